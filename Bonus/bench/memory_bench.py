@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Per-instance memory of taskmasterd's bookkeeping, before and after ProgramSpec/ProcessRecord.
+
+"before" rebuilds what the daemon used to keep: a config dict copied for
+every instance it starts, plus one info dict per instance. "after" shares
+one ProgramSpec per program and stores a ProcessRecord per instance in the
+ProcessTable. Both are measured with tracemalloc.
+
+Usage: python3 memory_bench.py [instances] [instances_per_program]
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'daemon'))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'common'))
+
+from program_spec import ProgramSpec
+from process_table import ProcessTable
+
+CONFIG = {
+    'cmd': '/usr/bin/python3 worker.py --queue jobs',
+    'numprocs': 10,
+    'autostart': True,
+    'autorestart': 'unexpected',
+    'exitcodes': [0, 2],
+    'starttime': 3,
+    'startretries': 3,
+    'stopsignal': 'TERM',
+    'stoptime': 10,
+    'stdout': '/var/log/taskmaster/worker.stdout',
+    'stderr': '/var/log/taskmaster/worker.stderr',
+    'env': {'STARTED_BY': 'taskmaster', 'ANSWER': '42'},
+    'workingdir': '/tmp',
+    'umask': 0o022,
+}
+
+
+def instance_names(count, per_program):
+    for index in range(count):
+        program_name = f"program{index // per_program}"
+        yield program_name, f"{program_name}_{index % per_program:02d}"
+
+
+def before(count, per_program):
+    programs = {}
+    process_info = {}
+    running_processes = {}
+    jobs = []
+    for pid, (program_name, indexed_name) in enumerate(instance_names(count, per_program), 1000):
+        if program_name not in programs:
+            programs[program_name] = dict(CONFIG, env=dict(CONFIG['env']), exitcodes=list(CONFIG['exitcodes']))
+        program = programs[program_name].copy()
+        program["name"] = program_name
+        jobs.append((program, indexed_name))
+        running_processes.setdefault(program_name, []).append(pid)
+        process_info[indexed_name] = {
+            "retries": 0,
+            "start_time": time.time(),
+            "pid": pid,
+            "state": "RUNNING",
+            "program_name": program_name,
+            "master_fd": pid % 1024,
+        }
+    return programs, process_info, running_processes, jobs
+
+
+def after(count, per_program):
+    programs = {}
+    process_info = ProcessTable()
+    running_processes = {}
+    jobs = []
+    for pid, (program_name, indexed_name) in enumerate(instance_names(count, per_program), 1000):
+        if program_name not in programs:
+            programs[program_name] = ProgramSpec(program_name, **CONFIG)
+        jobs.append((programs[program_name], indexed_name))
+        running_processes.setdefault(program_name, []).append(pid)
+        process_info.register(indexed_name, program_name, pid, 0, "RUNNING", pid % 1024, time.time())
+    return programs, process_info, running_processes, jobs
+
+
+def measure(build, count, per_program):
+    gc.collect()
+    tracemalloc.start()
+    state = build(count, per_program)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del state
+    return current, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    per_program = int(sys.argv[2]) if len(sys.argv) > 2 else CONFIG['numprocs']
+
+    print(f"{count} instances, {per_program} per program")
+    print(f"{'':8} {'retained':>12} {'per instance':>14} {'peak':>12}")
+    results = {}
+    for label, build in (("before", before), ("after", after)):
+        current, peak = measure(build, count, per_program)
+        results[label] = current
+        print(f"{label:8} {current / 1024:10.0f} KiB {current / count:12.0f} B {peak / 1024:10.0f} KiB")
+    print(f"saved    {(1 - results['after'] / results['before']) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Cost of one /proc sampling pass over N supervised processes.
+
+"open/read" opens, reads and closes /proc/<pid>/stat and statm and lists
+/proc/<pid>/fd for every pid, which is what reading usage on demand costs.
+"sampler" is ProcSampler.sample_all() once its files are open: two preads
+and one stat() per pid, results stored in its arrays.
+
+Usage: python3 sampler_bench.py [processes] [passes]
+"""
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'daemon'))
+
+from process_table import ProcessTable
+from proc_sampler import ProcSampler
+
+
+def open_read(pids):
+    for pid in pids:
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            f.read()
+        with open(f"/proc/{pid}/statm", 'rb') as f:
+            f.read()
+        len(os.listdir(f"/proc/{pid}/fd"))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    passes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    children = [subprocess.Popen(['sleep', '600']) for _ in range(count)]
+    try:
+        table = ProcessTable()
+        for index, child in enumerate(children):
+            table.register(f"bench_{index:05d}", "bench", child.pid, 0, "RUNNING")
+        sampler = ProcSampler(table)
+        sampler.sample_all()
+        pids = [child.pid for child in children]
+
+        print(f"{count} processes, {passes} passes")
+        for label, run in (("open/read", lambda: open_read(pids)), ("sampler", sampler.sample_all)):
+            started = time.perf_counter()
+            for _ in range(passes):
+                run()
+            elapsed = (time.perf_counter() - started) / passes
+            print(f"{label:10} {elapsed * 1000:8.2f} ms/pass {elapsed / count * 1e6:8.2f} us/process")
+    finally:
+        for child in children:
+            child.kill()
+        for child in children:
+            child.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,182 @@
 import socket
 import sys
 import os
+import json
+import time
 import tty
 import termios
 import select
+from collections import deque
 from termcolor import colored
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from protocol import (
+    FrameDecoder, encode_frame, CONTROL_CHANNEL, REQUEST, REPLY, END, DATA, CLOSE
+)
+
 class TaskmasterCtlClient:
     def __init__(self, host='localhost', port=12345):
         self.host = host
         self.port = port
         self.sock = None
+        self.decoder = None
+        self.next_request_id = 1
+        self.replies = {}
+        self.completed = set()
+        self.channel_frames = deque()
 
     def connect(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.connect((self.host, self.port))
+        self.decoder = FrameDecoder()
+        self.replies = {}
+        self.completed = set()
+        self.channel_frames.clear()
+
+    def _new_request(self, command):
+        request_id = self.next_request_id
+        self.next_request_id = self.next_request_id % 0xFFFFFFFF + 1
+        return request_id, encode_frame(REQUEST, request_id, CONTROL_CHANNEL, command)
+
+    def _read_frames(self):
+        """Receive once and sort the frames into replies and attach traffic."""
+        data = self.sock.recv(65536)
+        if not data:
+            raise ConnectionError("Connection closed by the server.")
+        for frame in self.decoder.feed(data):
+            if frame.type == REPLY:
+                self.replies.setdefault(frame.request_id, []).append(frame.payload)
+            elif frame.type == END:
+                self.completed.add(frame.request_id)
+            else:
+                self.channel_frames.append(frame)
+
+    def _wait_reply(self, request_id):
+        while request_id not in self.completed:
+            self._read_frames()
+        self.completed.discard(request_id)
+        return b"".join(self.replies.pop(request_id, [])).decode('utf-8')
 
     def send_command(self, command):
         if not self.sock:
             raise ConnectionError("Not connected to the server.")
-        
-        self.sock.sendall(command.encode('utf-8'))
-        response = self.sock.recv(4096).decode('utf-8')
-        return response
+
+        request_id, frame = self._new_request(command)
+        self.sock.sendall(frame)
+        return self._wait_reply(request_id)
+
+    def request(self, command):
+        """Send a command and decode its structured (JSON) reply."""
+        return json.loads(self.send_command(command))
+
+    def send_commands(self, commands):
+        """Pipeline several commands in one write and return their replies in order."""
+        if not self.sock:
+            raise ConnectionError("Not connected to the server.")
+
+        requests = [self._new_request(command) for command in commands]
+        self.sock.sendall(b"".join(frame for _, frame in requests))
+        return [self._wait_reply(request_id) for request_id, _ in requests]
+
+    @staticmethod
+    def print_errors(reply):
+        """Print the messages of a reply that refused a request."""
+        for item in reply.get("messages", []):
+            print(colored(item["text"], "red" if item["level"] == "error" else "yellow"))
 
     def close(self):
         if self.sock:
             self.sock.close()
             self.sock = None
+
+    def watch(self, on_event, on_resync, reconnect_delay=1.0):
+        """Follow state transitions pushed by the daemon until Ctrl+C.
+
+        on_event(event) gets each transition as a dict. on_resync(reply) gets
+        the structured reply of a full `status` whenever the stream could not be resumed exactly, i.e.
+        on the first subscription and after the daemon restarted or the
+        client fell too far behind. After a lost connection the client
+        reconnects and resumes from the last sequence number it saw.
+        """
+        since = None
+        channel = None
+        while True:
+            try:
+                if self.sock is None:
+                    self.connect()
+                request = f"status --watch --since {since}" if since else "status --watch"
+                reply = self.request(request)
+                if not reply.get("ok"):
+                    self.print_errors(reply)
+                    return
+                channel, epoch = reply["channel"], reply["epoch"]
+                if reply["mode"] != "resumed":
+                    since = f"{epoch}:{reply['seq']}"
+                    on_resync(self.request("status"))
+
+                pending = b""
+                subscribed = True
+                while subscribed:
+                    while self.channel_frames:
+                        frame = self.channel_frames.popleft()
+                        if frame.channel != channel:
+                            continue
+                        if frame.type == CLOSE:
+                            # Dropped for falling behind: subscribe again from where we are.
+                            subscribed = False
+                            channel = None
+                            break
+                        pending += frame.payload
+                        *lines, pending = pending.split(b"\n")
+                        for line in lines:
+                            event = json.loads(line)
+                            since = f"{epoch}:{event['seq']}"
+                            on_event(event)
+                    if subscribed:
+                        self._read_frames()
+
+            except KeyboardInterrupt:
+                if channel is not None and self.sock:
+                    try:
+                        self.sock.sendall(encode_frame(CLOSE, 0, channel))
+                    except OSError:
+                        pass
+                return
+            except (ConnectionError, OSError) as e:
+                print(colored(f"Connection lost ({e}), reconnecting...", "yellow"))
+                self.close()
+                channel = None
+                try:
+                    time.sleep(reconnect_delay)
+                except KeyboardInterrupt:
+                    return
             
-    def attach(self, program_name):
-        """Attach to a running process's console"""
+    def attach(self, program_name, readonly=False, request=None):
+        """Attach to a running process's console.
+
+        request overrides the command sent, e.g. 'tail <program> -n 20 -f'.
+        """
         try:
-            self.sock.sendall(f"attach {program_name}".encode('utf-8'))
-            response = self.sock.recv(4096).decode('utf-8')
-            
-            if response.startswith("Error:"):
-                print(colored(response, "red"))
+            if request is None:
+                request = f"attach {program_name} --readonly" if readonly else f"attach {program_name}"
+            try:
+                reply = self.request(request)
+            except ValueError:
+                print(colored("Error: Invalid server response", "red"))
                 return
-            
-            if not response.startswith("ATTACH_OK|"):
-                print(colored(f"Error: Invalid server response: {response}", "red"))
+
+            if not reply.get("ok"):
+                self.print_errors(reply)
                 return
-            
+
             try:
-                pid = int(response.split("|")[1].strip())
-            except (IndexError, ValueError):
+                pid, channel, mode = int(reply["pid"]), int(reply["channel"]), reply["mode"]
+            except (KeyError, TypeError, ValueError):
                 print(colored("Error: Invalid process information", "red"))
                 return
             
-            print(colored(f"\n=== Attached to {program_name} (pid {pid}) ===", "green"))
+            watching = " (read-only)" if mode == "ro" else ""
+            print(colored(f"\n=== Attached to {program_name} (pid {pid}){watching} ===", "green"))
             print(colored("Press Ctrl+D or Ctrl+C to detach\n", "yellow"))
             
             # Save terminal settings
@@ -57,32 +184,52 @@ class TaskmasterCtlClient:
                 old_settings = termios.tcgetattr(sys.stdin.fileno())
             except termios.error:
                 print(colored("Error: Not running in a terminal", "red"))
+                self.sock.sendall(encode_frame(CLOSE, 0, channel))
                 return
             
+            terminated = False
             try:
                 tty.setraw(sys.stdin.fileno())
-                self.sock.setblocking(False)
                 
                 detached = False
-                buffer = ""  
                 
                 while not detached:
+                    # Frames for this channel may already have arrived with an earlier reply.
+                    wrote = False
+                    while self.channel_frames:
+                        frame = self.channel_frames.popleft()
+                        if frame.channel != channel:
+                            continue
+                        if frame.type == CLOSE:
+                            print(colored("\n[Process terminated]", "red"))
+                            terminated = detached = True
+                            break
+                        sys.stdout.buffer.write(frame.payload)
+                        wrote = True
+                    if wrote:
+                        sys.stdout.buffer.flush()
+                    if detached:
+                        break
+
                     readable, _, _ = select.select([sys.stdin, self.sock], [], [], 0.1)
                     
                     if sys.stdin in readable:
                         try:
-                            char = os.read(sys.stdin.fileno(), 1)
+                            # Forward everything typed since the last read as one frame.
+                            keys = os.read(sys.stdin.fileno(), 4096)
                             
-                            if char in (b'\x04', b'\x03'):  # Ctrl+D or Ctrl+C
+                            # Ctrl+D or Ctrl+C detaches; keys typed before it are still sent
+                            detach_at = [i for i in (keys.find(b'\x04'), keys.find(b'\x03')) if i >= 0]
+                            if detach_at:
+                                keys = keys[:min(detach_at)]
                                 detached = True
-                                break
                             
-                            # Send character to server
-                            cmd = f"process_input {program_name} {char.hex()}"
-                            try:
-                                self.sock.sendall(cmd.encode('utf-8'))
-                            except (socket.error, BrokenPipeError):
-                                detached = True
+                            if keys and mode == "rw":
+                                try:
+                                    self.sock.sendall(encode_frame(DATA, 0, channel, keys))
+                                except (socket.error, BrokenPipeError):
+                                    detached = True
+                            if detached:
                                 break
                                 
                         except OSError:
@@ -92,43 +239,10 @@ class TaskmasterCtlClient:
                     # Handle process output
                     if self.sock in readable:
                         try:
-                            data = self.sock.recv(4096)
-                            if not data:
-                                detached = True
-                                break
-                            
-                            # Add received data to buffer
-                            buffer += data.decode('utf-8')
-                            
-                            # Process all complete messages (delimited by \n)
-                            while '\n' in buffer:
-                                line, buffer = buffer.split('\n', 1)
-                                line = line.strip()
-                                
-                                if not line:
-                                    continue
-                                
-                                if line.startswith("output:"):
-                                    hex_data = line[7:]
-                                    try:
-                                        output = bytes.fromhex(hex_data)
-                                        sys.stdout.buffer.write(output)
-                                        sys.stdout.buffer.flush()
-                                    except ValueError:
-                                        # Invalid hex, skip it
-                                        pass
-                                        
-                                elif line == "terminated":
-                                    print(colored("\n[Process terminated]", "red"))
-                                    detached = True
-                                    break
-                                
-                        except socket.error as e:
-                            if e.errno not in (11, 35):  # Not EAGAIN/EWOULDBLOCK
-                                detached = True
-                                break
-                        except UnicodeDecodeError:
-                            continue
+                            self._read_frames()
+                        except (ConnectionError, socket.error):
+                            detached = True
+                            break
             
             finally:
                 # Restore terminal settings
@@ -139,23 +253,12 @@ class TaskmasterCtlClient:
                 
                 print(colored(f"\n=== Detached from {program_name} ===\n", "yellow"))
                 
-                # Close and reconnect
-                try:
-                    self.sock.setblocking(True)
-                    self.sock.sendall(f"detach {program_name}".encode('utf-8'))
-                    self.sock.close()
-                except:
-                    pass
-                
-                # Reconnect for next commands
-                try:
-                    self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    self.sock.connect((self.host, self.port))
-                except Exception as e:
-                    print(colored(f"Warning: Could not reconnect: {e}", "yellow"))
+                # Close the attach channel; the connection stays usable for commands
+                if not terminated:
+                    try:
+                        self.sock.sendall(encode_frame(CLOSE, 0, channel))
+                    except Exception as e:
+                        print(colored(f"Warning: Could not detach cleanly: {e}", "yellow"))
         
         except Exception as e:
             print(colored(f"Error during attach: {e}", "red"))
-        
-        
-            
\ No newline at end of file
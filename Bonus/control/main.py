@@ -1,21 +1,121 @@
 from client import TaskmasterCtlClient
+from termcolor import colored
+import json
 import readline
 import sys
+import time
+
+STATE_COLORS = {"RUNNING": "green", "FATAL": "red", "STOPPED": "red", "EXITED": "red", "BACKOFF": "yellow"}
+LEVEL_COLORS = {"error": "red", "warning": "yellow", "success": "green", "info": "cyan"}
+
+
+def format_instance(instance):
+    """One line of `status`: '- name: STATE (details)'."""
+    state = instance["state"]
+    details = []
+    if state == "RUNNING":
+        details.append(f"pid {instance['pid']}, uptime {instance['uptime'] or 0}s")
+        if instance.get("rss_bytes") is not None:
+            details.append(f"cpu {instance['cpu_seconds']:.1f}s, rss {instance['rss_bytes'] / 1048576:.1f} MiB")
+    elif instance.get("message"):
+        details.append(instance["message"])
+    elif instance.get("exit_code") is not None and state in ("EXITED", "BACKOFF", "FATAL"):
+        details.append(f"exit status {instance['exit_code']}")
+    if instance.get("retries"):
+        details.append(f"retries {instance['retries']}")
+    suffix = f" ({'; '.join(details)})" if details else ""
+    generation = f" [gen {instance['generation']}]" if instance.get("generation") else ""
+    return f"- {instance['name']}{generation}: {colored(state, STATE_COLORS.get(state, 'yellow'))}{suffix}"
+
+
+def render_reply(reply):
+    """Turn a structured reply from taskmasterd into colored text."""
+    out = []
+    for item in reply.get("messages", []):
+        out.append(colored(item["text"], LEVEL_COLORS.get(item["level"], "white")))
+    if "instances" in reply:
+        out.append(colored("Program status:", 'cyan', attrs=['underline']))
+        out.extend(format_instance(instance) for instance in reply["instances"])
+    if "commands" in reply:
+        out.append(colored("Available commands:", 'cyan', attrs=['underline']))
+        for cmd, desc in reply["commands"].items():
+            out.append(colored(f"  {cmd:<28}", 'green') + colored(f" {desc}", 'white'))
+    if "output" in reply:
+        out.append(reply["output"].rstrip("\n"))
+    return "\n".join(out)
+
+
+def print_reply(response, as_json=False):
+    """Print a reply raw (--json) or rendered; returns False if the command failed."""
+    reply = json.loads(response)
+    print(response if as_json else render_reply(reply))
+    return reply.get("ok", True)
+
+
+def print_transition(event):
+    """Render one pushed state transition."""
+    stamp = time.strftime("%H:%M:%S", time.localtime(event["time"]))
+    to_state = colored(event["to"], STATE_COLORS.get(event["to"], "yellow"))
+    details = []
+    if event.get("pid"):
+        details.append(f"pid {event['pid']}")
+    if event.get("exit_code") is not None and event["to"] in ("EXITED", "BACKOFF", "FATAL"):
+        details.append(f"exit status {event['exit_code']}")
+    suffix = f" ({', '.join(details)})" if details else ""
+    print(f"[{stamp}] #{event['seq']} {event['name']}: {event['from'] or '-'} -> {to_state}{suffix}")
+
+
+def watch_status(client, as_json=False):
+    if as_json:
+        # One JSON document per line: the status replies and the transitions.
+        client.watch(lambda event: print(json.dumps(event), flush=True),
+                     lambda reply: print(json.dumps(reply), flush=True))
+        return
+    print(colored("Watching state changes, Ctrl+C to stop", "yellow"))
+    client.watch(print_transition, lambda reply: print(render_reply(reply)))
 
 def main():
     client = TaskmasterCtlClient(host="127.0.0.1", port=12345)
-    # Check if attach command was provided as argument
-    if len(sys.argv) > 2 and sys.argv[1] == "attach":
+    # --json prints the daemon's replies as they come, for scripts
+    as_json = "--json" in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != "--json"]
+
+    if len(args) > 1 and args[0] == "status" and "--watch" in args[1:]:
+        try:
+            client.connect()
+        except Exception as e:
+            print("Initial connect failed, will retry:", e)
+            client.close()
+        watch_status(client, as_json)
+        client.close()
+        return
+
+    if len(args) > 1 and (args[0] == "attach" or (args[0] == "tail" and "-f" in args[2:])):
         try:
             client.connect()
             print("Connected to Taskmaster server.")
-            client.attach(sys.argv[2])
+            if args[0] == "tail":
+                client.attach(args[1], readonly=True, request=" ".join(args))
+            else:
+                client.attach(args[1], readonly="--readonly" in args[2:])
         except Exception as e:
             print("Error:", e)
         finally:
             client.close()
         return
 
+    if args:
+        # One-shot: taskmasterctl [--json] <command> [args]
+        try:
+            client.connect()
+            ok = print_reply(client.send_command(" ".join(args)), as_json)
+        except Exception as e:
+            print("Error:", e)
+            ok = False
+        finally:
+            client.close()
+        sys.exit(0 if ok else 1)
+
     # Interactive mode
     try:
         client.connect()
@@ -44,11 +144,15 @@ def main():
                     
                 if cmd_parts[0] == "attach" and len(cmd_parts) > 1:
                     # Handle attach command specially
-                    client.attach(cmd_parts[1])
+                    client.attach(cmd_parts[1], readonly="--readonly" in cmd_parts[2:])
+                elif cmd_parts[0] == "status" and "--watch" in cmd_parts[1:]:
+                    watch_status(client, as_json)
+                elif cmd_parts[0] == "tail" and "-f" in cmd_parts[2:]:
+                    # Following output is a read-only attach
+                    client.attach(cmd_parts[1], readonly=True, request=cmd)
                 else:
                     # Handle other commands normally
-                    response = client.send_command(cmd)
-                    print(response)
+                    print_reply(client.send_command(cmd), as_json)
             except (BrokenPipeError, ConnectionResetError, OSError, ConnectionError) as conn_err:
                 print("Connection error:", conn_err, "- attempting to reconnect...")
                 retry_count = 0
@@ -57,8 +161,7 @@ def main():
                     try:
                         client.connect()
                         print("Reconnected.")
-                        response = client.send_command(cmd)
-                        print(response)
+                        print_reply(client.send_command(cmd), as_json)
                         break
                     except Exception as retry_err:
                         retry_count += 1
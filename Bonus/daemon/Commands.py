@@ -1,220 +1,346 @@
 import os
 import sys
 import time
-import signal
 import pty
-from ParseConfige import ConfigParser
-from termcolor import colored
-import select
-from helper import exec_child_process
+import threading
+from helper import exec_child_process, program_log, restart_on_exit
+from pty_hub import hub as pty_hub
 from sendEmail import EmailAlerter
-import socket
+from alert_policy import AlertPolicy
+from reaper import ChildReaper
+from process_table import ProcessTable
+from state_feed import StateFeed
+from proc_sampler import ProcSampler
+from metrics import Metrics
+from scheduler import Scheduler
+from backoff import Backoff
 from reload_handler import ReloadHandler
+from rollout import RollingRestart, parse_rollout_args
+from reply import message, encode
 class Commands:
     VALID_CMDS = {"start", "stop", "restart",
-                  "status", "reload", "exit", "help", "attach", "detach"}
+                  "status", "reload", "exit", "help", "attach", "detach", "tail", "metrics"}
 
-    def __init__(self, programs=None, running_processes=None):
+    DEFAULT_MAX_PARALLEL_STARTS = 16
+    TAIL_LINES = 10
+    ATTACH_REPLAY_LINES = 100
+
+    def __init__(self, programs=None, running_processes=None, max_parallel_starts=DEFAULT_MAX_PARALLEL_STARTS,
+                 sample_interval=ProcSampler.DEFAULT_INTERVAL):
         self.programs = programs or {}
         self.running_processes = running_processes if running_processes is not None else {}
-        self.process_info = {}
+        self.process_info = ProcessTable()
+        self.state_feed = StateFeed()
+        self.process_info.add_listener(self.state_feed.publish)
+        # Resource usage is sampled in the background; metrics only read the cache.
+        self.sampler = ProcSampler(self.process_info, sample_interval)
+        self.metrics = Metrics(self.process_info, self.sampler)
+        self.process_info.add_listener(self.metrics.on_state_change)
         self.running = True
         self.is_attach = False
-
+        self.max_parallel_starts = max_parallel_starts
+        self.spawn_lock = threading.Lock()
+        # Serializes commands that change process state; status and help never take it.
+        self.lock = threading.RLock()
+
+        # Start windows, restart delays and alert quiet periods are timers here;
+        # no thread sleeps on them.
+        self.scheduler = Scheduler()
         self.email_alerter = EmailAlerter()
+        # Every event that is logged or mailed goes through the policy.
+        self.alerts = AlertPolicy(self.email_alerter, self.scheduler)
+        self.reaper = ChildReaper()
+        self.reaper.add_listener(self.on_child_exit)
+        self.backoffs = {}
+        self.pending_starts = {}
+        self.pending_lock = threading.Lock()
+        # The InstanceStart in flight for each instance, from an autorestart waiting
+        # for its delay to a start in its window or backoff; one cancel() stops it.
+        self.starts = {}
+        # Bumped each time a program's instances are replaced with a new configuration.
+        self.generations = {}
+        self.pty_hub = pty_hub
+
+    def backoff_for(self, indexed_name, program):
+        """The restart backoff of an instance, kept across starts."""
+        backoff = self.backoffs.get(indexed_name)
+        if backoff is None:
+            backoff = self.backoffs[indexed_name] = Backoff.from_config(program)
+        return backoff
+
+    def generation_of(self, program_name):
+        """The configuration generation new instances of a program are started from."""
+        return self.generations.get(program_name, 0)
+
+    def schedule_respawn(self, indexed_name, program):
+        """Start an instance that died while RUNNING again, per its autorestart setting.
+
+        An instance that had been up for backoff_reset seconds comes back at
+        once; one that keeps dying waits for its backoff delay.
+        """
+        backoff = self.backoff_for(indexed_name, program)
+        if backoff.stable():
+            backoff.reset()
+            delay = 0.0
+        else:
+            delay = backoff.next_delay()
+        from start_handler import StartHandler, InstanceStart
+        print(f"INFO restarting: '{indexed_name}' in {delay:.2f}s (autorestart)")
+        # A stop, a start by hand or a reload cancels it like any other start in flight.
+        # This runs on the reaper and scheduler threads, outside self.lock: the
+        # start's own lock orders its steps against that cancel().
+        InstanceStart(StartHandler(self), program, indexed_name, [], self.is_attach).attempt_later(delay)
+
+    def forget_instance(self, indexed_name):
+        """Drop everything the daemon keeps about an instance that is gone."""
+        master_fd = self.process_info[indexed_name].get('master_fd')
+        if master_fd:
+            self.pty_hub.release(master_fd)
+        self.pty_hub.discard_scrollback(indexed_name)
+        self.alerts.forget(indexed_name)
+        self.metrics.forget(indexed_name)
+        self.backoffs.pop(indexed_name, None)
+        self.cancel_start(indexed_name)
+        self.process_info.remove(indexed_name)
+
+    def replace_instance(self, indexed_name, replacement):
+        """Hand the name of a stopped instance over to the instance started to replace it.
+
+        The replacement keeps its process, output and backoff; the name keeps
+        its metrics history.
+        """
+        info = self.process_info.remove(indexed_name)
+        if info is not None and info.master_fd:
+            self.pty_hub.release(info.master_fd)
+        self.cancel_start(indexed_name)
+        self.cancel_start(replacement)
+        self.alerts.forget(replacement)
+        self.metrics.replace(indexed_name, replacement)
+        backoff = self.backoffs.pop(replacement, None)
+        if backoff is not None:
+            self.backoffs[indexed_name] = backoff
+        self.pty_hub.rename(replacement, indexed_name)
+        self.process_info.rename(replacement, indexed_name)
+
+    def track_start(self, indexed_name, start):
+        """Make start the one start in flight for an instance, cancelling any other."""
+        self.cancel_start(indexed_name)
+        self.starts[indexed_name] = start
+
+    def untrack_start(self, indexed_name, start):
+        if self.starts.get(indexed_name) is start:
+            del self.starts[indexed_name]
+
+    def cancel_start(self, indexed_name):
+        """Cancel the pending autorestart or the start (and its retries) in flight for an instance."""
+        start = self.starts.pop(indexed_name, None)
+        if start is not None:
+            start.cancel()
+
+    def watch_start(self, pid, start, spawned_at):
+        """Route the exit of a child in its start window to its InstanceStart."""
+        with self.pending_lock:
+            self.pending_starts[pid] = start
+        # The child may have died before it was registered; the reaper kept its exit.
+        exit_code = self.reaper.exit_since(pid, spawned_at)
+        if exit_code is not None and self.claim_start(pid) is not None:
+            start.on_exit(pid, exit_code)
+
+    def claim_start(self, pid):
+        """Take the pending start of pid, so only one of its exit and its start timer handles it."""
+        with self.pending_lock:
+            return self.pending_starts.pop(pid, None)
+
+    def on_child_exit(self, pid, exit_code):
+        """Record an exit reported by the reaper against the instance that owned the pid."""
+        start = self.claim_start(pid)
+        if start is not None:
+            self.process_info.update(self.process_info.find_pid(pid), exit_code=exit_code)
+            start.on_exit(pid, exit_code)
+            return
+        indexed_name = self.process_info.find_pid(pid)
+        if indexed_name is None:
+            return
+        info = self.process_info.update(indexed_name, exit_code=exit_code)
+        state = info.get('state')
+        if state == 'STARTING':
+            # StartHandler is waiting on this child and decides between a retry and FATAL.
+            self.process_info.update(indexed_name, state='BACKOFF')
+        elif state == 'RUNNING':
+            self.process_info.update(indexed_name, state='EXITED', pid=0,
+                                     message=f"exited with status {exit_code}")
+            program_pids = self.running_processes.get(info.get('program_name'), [])
+            if pid in program_pids:
+                program_pids.remove(pid)
+            print(f"INFO exited: '{indexed_name}' (pid {pid}) with exit status {exit_code}")
+            program = self.programs.get(info.get('program_name'))
+            expected = program is not None and exit_code in program.get("exitcodes", [0])
+            if expected:
+                self.alerts.notify(indexed_name, "PROCESS_EXITED",
+                                   f"'{indexed_name}' (pid {pid}) exited with code {exit_code}")
+            else:
+                self.alerts.notify(indexed_name, "PROCESS_DIED",
+                                   f"Process '{indexed_name}' (pid {pid}) died unexpectedly with exit code {exit_code}",
+                                   subject=f"Process {indexed_name} Failed", severity="ERROR")
+            if program is not None and restart_on_exit(program.get("autorestart", "unexpected"),
+                                                       exit_code, program.get("exitcodes", [0])):
+                self.schedule_respawn(indexed_name, program)
+        elif state == 'STOPPING':
+            self.process_info.update(indexed_name, state='STOPPED')
 
     # ---------------------------------------------------------------------- #
     #                          ATTACH/DETACH COMMANDS                        #
     # ---------------------------------------------------------------------- #
 
-    def monitor_process(self, client_socket, process_info):
-        """Monitor process output and send to client"""
-        master_fd = process_info.get('master_fd')
-        program_name = process_info.get('program_name')
-
-        while process_info.get('attached', False):
-            try:
-                r, _, _ = select.select([master_fd], [], [], 0.1)
-                if master_fd in r:
-                    try:
-                        output = os.read(master_fd, 4096)
-                        if output:
-                            response = f"output:{output.hex()}"
-                            client_socket.sendall(response.encode('utf-8'))
-                        else:
-                            client_socket.sendall(b"terminated")
-                            break
-                    except OSError:
-                        client_socket.sendall(b"terminated")
-                        break
-            except Exception as e:
-                print(f"Error monitoring process {program_name}: {e}")
-                break
-
-        process_info['attached'] = False
-
     def verify_attach(self, program_name):
-        """Verify if a program can be attached to"""
+        """Verify if a program can be attached to; returns the error messages, if any."""
+        def error(text):
+            return [message(f"Error: {text}", "error")]
+
         try:
             if not program_name:
-                return "Error: Program name required"
+                return error("Program name required")
 
             if program_name not in self.process_info:
-                return f"Error: Program '{program_name}' is not running"
+                return error(f"Program '{program_name}' is not running")
 
             process_info = self.process_info[program_name]
             master_fd = process_info.get('master_fd')
             pid = process_info.get('pid')
 
             if not master_fd:
-                return f"Error: Process '{program_name}' has no attached terminal"
+                return error(f"Process '{program_name}' has no attached terminal")
 
             if not pid or pid == 0:
-                return f"Error: Process '{program_name}' is not running"
+                return error(f"Process '{program_name}' is not running")
 
             try:
                 os.kill(pid, 0)
             except ProcessLookupError:
-                return f"Error: Process '{program_name}' (pid {pid}) is not running"
+                return error(f"Process '{program_name}' (pid {pid}) is not running")
 
             # if process_info.get('attached'):
-            #     return f"Error: Already attached to process '{program_name}'"
+            #     return error(f"Already attached to process '{program_name}'")
             
             self.is_attach = True  # Set is_attach to True when verifying attach command
-            return f"ATTACH_OK|{pid}"
+            return []
 
         except Exception as e:
-            return f"Error: {str(e)}"
-
-    def handle_attached_session(self, program_name, client_socket):
-        """Handle an attached session with bidirectional I/O"""
+            return error(str(e))
+
+    def parse_output_args(self, args, default_lines):
+        """Split '<instance> [-n N] [-f] [--readonly]' into (name, lines, follow, readonly)."""
+        parts = (args or "").split()
+        name, lines, follow, readonly = None, default_lines, False, False
+        i = 0
+        while i < len(parts):
+            part = parts[i]
+            if part == "-n" and i + 1 < len(parts):
+                lines = int(parts[i + 1])
+                i += 2
+                continue
+            if part == "-f":
+                follow = True
+            elif part in ("--readonly", "-r"):
+                readonly = True
+            elif name is None:
+                name = part
+            i += 1
+        return name, lines, follow, readonly
+
+    def tail_command(self, args):
+        """Return the last lines of an instance's output from its scrollback."""
         try:
-            process_info = self.process_info[program_name]
-            process_info['attached'] = True
-
-            master_fd = process_info.get('master_fd')
+            program_name, lines, _, _ = self.parse_output_args(args, self.TAIL_LINES)
+        except ValueError:
+            return [message("Error: -n expects a number of lines", "error")]
+        if not program_name:
+            return [message("Error: Program name required", "error")]
+
+        output = self.pty_hub.tail(program_name, lines)
+        if output is None:
+            return [message(f"Error: No output recorded for '{program_name}'", "error")]
+        return {"name": program_name, "output": output.decode('utf-8', 'replace').replace('\r\n', '\n')}
+
+    def handle_attached_session(self, program_name, connection, request_id, readonly=False, replay_lines=0,
+                                command="attach"):
+        """Subscribe a client connection to an instance's PTY over a new channel.
+
+        The PTY hub reads the terminal once and fans its output out to every
+        subscriber; only the read-write subscriber's keystrokes reach the process.
+        The reply carries the pid, the channel and the mode ("rw" or "ro").
+        """
+        process_info = self.process_info[program_name]
+        master_fd = process_info.get('master_fd')
+        pid = process_info.get('pid')
+        subscription = {}
 
+        def on_input(payload):
+            try:
+                self.pty_hub.write_input(subscription['subscriber'], payload)
+            except OSError:
+                self.pty_hub.unsubscribe(subscription['subscriber'])
 
-            client_socket.setblocking(False)
-            self.is_attach = True
-            while process_info.get('attached', False):
-                try:
-                    readable, _, _ = select.select(
-                        [master_fd, client_socket], [], [], 0.1)
-
-                    if master_fd in readable:
-                        try:
-                            output = os.read(master_fd, 4096)
-                            if output:
-                                hex_output = output.hex()
-
-                                response = f"output:{hex_output}\n"
-
-                                try:
-                                    client_socket.sendall(
-                                        response.encode('utf-8'))
-                                except (BrokenPipeError, socket.error, OSError) as e:
-                                    break
-                            else:
-                                print(f"[DEBUG] Process EOF")
-                                try:
-                                    client_socket.sendall(b"terminated\n")
-                                except:
-                                    pass
-                                break
-                        except OSError as e:
-                            try:
-                                client_socket.sendall(b"terminated\n")
-                            except:
-                                pass
-                            break
-
-                    if client_socket in readable:
-                        try:
-                            data = client_socket.recv(4096)
-                            if not data:
-                                break
-
-                            command = data.decode('utf-8').strip()
-
-                            if command.startswith("process_input "):
-                                parts = command.split(' ', 2)
-                                if len(parts) == 3:
-                                    _, pname, hex_data = parts
-                                    try:
-                                        input_bytes = bytes.fromhex(hex_data)
-                                        os.write(master_fd, input_bytes)
-                                    except ValueError as e:
-                                        break
-
-                            elif command.startswith("detach "):
-                                break
-
-                        except socket.error as e:
-                            if e.errno not in (11, 35):
-                                break
-                        except UnicodeDecodeError as e:
-                            continue
-
-                except select.error as e:
-                    break
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    break
+        def on_channel_closed():
+            self.pty_hub.unsubscribe(subscription['subscriber'])
+            self.process_info.update(program_name, attached=self.pty_hub.subscriber_count(master_fd) > 0)
 
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-        finally:
-            process_info[program_name]['attached'] = False
-            try:
-                client_socket.setblocking(True)
-            except:
-                pass
+        channel = connection.open_channel(on_input, on_channel_closed)
+        try:
+            subscriber = self.pty_hub.subscribe(
+                program_name, master_fd,
+                send=lambda data: connection.send_data(channel, data),
+                on_close=lambda: connection.close_channel(channel),
+                readonly=readonly,
+                replay_lines=replay_lines
+            )
+        except OSError as e:
+            connection.channels.pop(channel, None)
+            connection.send_reply(request_id, encode(command, [message(f"Error: {e}", "error")]))
+            return
+        subscription['subscriber'] = subscriber
+        self.process_info.update(program_name, attached=True)
+        self.is_attach = True
+        mode = "rw" if subscriber.writable else "ro"
+        connection.send_reply(request_id, encode(command, {"name": program_name, "pid": pid, "channel": channel,
+                                                           "mode": mode}))
+
+    def handle_watch_session(self, args, connection, request_id):
+        """Push every state transition to a client over a new channel (`status --watch`).
+
+        The reply carries the channel, the feed's epoch and sequence number
+        (seq) and the mode ("resumed" or "resync"); the events follow on the
+        channel as JSON lines.
+        """
+        parts = (args or "").split()
+        since = None
+        if "--since" in parts and parts.index("--since") + 1 < len(parts):
+            since = parts[parts.index("--since") + 1]
+        subscription = {}
+
+        def on_channel_closed():
+            self.state_feed.unsubscribe(subscription['subscriber'])
+
+        channel = connection.open_channel(lambda payload: None, on_channel_closed)
+        subscriber, seq, resumed = self.state_feed.subscribe(
+            send=lambda data: connection.send_data(channel, data),
+            on_close=lambda: connection.close_channel(channel),
+            since=since
+        )
+        subscription['subscriber'] = subscriber
+        mode = "resumed" if resumed else "resync"
+        connection.send_reply(request_id, encode("status", {"channel": channel, "epoch": self.state_feed.epoch,
+                                                            "seq": seq, "mode": mode}))
 
     def detach_command(self, program_name):
-        """Handle detach request"""
+        """Handle detach request: end every attach session of the instance"""
         try:
             if program_name in self.process_info:
-                self.process_info[program_name]['attached'] = False
-            return "OK"
+                self.pty_hub.detach_all(self.process_info[program_name].get('master_fd'))
+                self.process_info.update(program_name, attached=False)
+            return [message(f"Detached every session of '{program_name}'.", "success")]
         except Exception as e:
-            return f"Error: {str(e)}"
-
-    def process_input(self, command):
-        """Handle input received from client for attached process"""
-        try:
-            parts = command.split(' ', 2)
-            if len(parts) != 3:
-                return colored("Error: Invalid input command format", "red")
-
-            _, program_name, hex_data = parts
-
-            if program_name not in self.process_info:
-                return colored("Error: Process not found", "red")
-
-            process_info = self.process_info[program_name]
-            if not process_info.get('attached'):
-                return colored("Error: Not attached to process", "red")
-
-            master_fd = process_info.get('master_fd')
-            if not master_fd:
-                return colored("Error: Process has no terminal", "red")
-
-            try:
-                input_bytes = bytes.fromhex(hex_data)
-                os.write(master_fd, input_bytes)
-                return "OK"
-
-            except OSError as e:
-                process_info['attached'] = False
-                return "terminated"
-
-        except ValueError:
-            return colored("Error: Invalid hex data", "red")
-        except Exception as e:
-            return colored(f"Error: {str(e)}", "red")
+            return [message(f"Error: {str(e)}", "error")]
 
     # ---------------------------------------------------------------------- #
     #                          RUN_PROCESS                                  #
@@ -223,11 +349,17 @@ class Commands:
     def run_process_with_pty(self, program, indexed_name, is_attach=False):
         """Run a process in a pseudo-terminal so it can be attached to"""
         master_fd, slave_fd = pty.openpty()
+        stderr_log = None if is_attach else program_log(program, 'stderr')
+        err_read, err_write = os.pipe() if stderr_log else (None, None)
         print(f"Starting process '{indexed_name}' with PID {os.getpid()}")
-        pid = os.fork()
+        # Instances are started from several threads; keep fork() itself serialized.
+        with self.spawn_lock:
+            pid = os.fork()
         if pid == 0: 
             try:
                 os.close(master_fd)
+                if err_read is not None:
+                    os.close(err_read)
 
                 os.setsid()
 
@@ -238,14 +370,25 @@ class Commands:
 
                 if slave_fd > 2:
                     os.close(slave_fd)
-                exec_child_process(program, indexed_name, is_attach)
+                exec_child_process(program, indexed_name, is_attach, err_write)
 
+            except SystemExit as e:
+                # Never unwind into the daemon's code from the forked child.
+                os._exit(e.code if isinstance(e.code, int) else 1)
             except Exception as e:
                 print(f"Error in child process: {e}", file=sys.stderr)
                 os._exit(1)
 
         else:  # Parent process
             os.close(slave_fd)
+            # The hub drains the terminal from now on, attached or not.
+            self.pty_hub.adopt(master_fd, indexed_name, program_log(program, 'stdout'),
+                               program.get('scrollback_bytes', self.pty_hub.DEFAULT_SCROLLBACK_BYTES))
+            if err_read is not None:
+                os.close(err_write)
+                self.pty_hub.adopt(err_read, f"{indexed_name}.stderr", stderr_log,
+                                   program.get('scrollback_bytes', self.pty_hub.DEFAULT_SCROLLBACK_BYTES),
+                                   close_on_eof=True)
             return pid, master_fd
 
     # ---------------------------------------------------------------------- #
@@ -283,30 +426,51 @@ class Commands:
     # ---------------------------------------------------------------------- #
 
     def help(self):
-        out = [colored("Available commands:", 'cyan', attrs=['underline'])]
-        for cmd, desc in {
+        """Describe the commands taskmasterctl can send."""
+        return {"commands": {
             "start [program]": "Start a service or all services",
             "stop [program]": "Stop a service or all services",
             "restart [program]": "Restart a service",
+            "restart [program] --rolling": "Restart instances in batches; --max-unavailable N (default 1), --surge M",
+            "restart [program] --surge": "Start a whole new generation next to the old one, then stop the old one",
             "status": "Show the current status of all programs",
+            "status --watch": "Stream state changes as they happen",
             "reload [program]": "Reload configuration and restart affected programs",
+            "reload [program] --rolling": "Reload, replacing changed programs' instances in batches (same options)",
+            "reload [program] --surge": "Reload with no downtime; rolls back if the new generation goes FATAL",
             "attach <program>": "Attach to a running service (view live output, Ctrl+D to detach)",
+            "attach <program> --readonly": "Watch a running service without typing into it",
+            "tail <program> [-n N] [-f]": "Show the last N lines of output (-f keeps following)",
+            "metrics": "Show daemon and per-instance metrics in Prometheus format",
             "help": "Show available commands",
             "exit": "Exit taskmasterctl",
-        }.items():
-            out.append(colored(f"  {cmd:<20}", 'green') +
-                       colored(f" {desc}", 'white'))
-        return "\n".join(out)
+        }}
 
     # ---------------------------------------------------------------------- #
     #                              RESTART COMMAND                           #
     # ---------------------------------------------------------------------- #
 
     def restart_command(self, program_name):
-        """Helper method to restart a specific program."""
-        self.stop_command(self.programs, program_name)
-        time.sleep(1)
-        return self.start_command(self.programs, program_name)
+        """Restart a program: all at once, or with --rolling a batch of instances at a time."""
+        try:
+            name, rolling, max_unavailable, surge = parse_rollout_args(program_name)
+        except ValueError as e:
+            return [message(f"Error: {e}", "error")]
+        if not rolling:
+            self.stop_command(self.programs, name)
+            time.sleep(1)
+            return self.start_command(self.programs, name)
+
+        if name is not None and name not in self.programs:
+            return [message(f"Error: rolling restart takes a program name, not '{name}'", "error")]
+        out = []
+        for pname in [name] if name else list(self.programs):
+            if not self.process_info.instances(pname):
+                out.append(message(f"Program '{pname}' has no instances to restart.", "warning"))
+                continue
+            program = self.programs[pname]
+            out.extend(RollingRestart(self, pname, program, program, max_unavailable, surge).run())
+        return out
 
     # ---------------------------------------------------------------------- #
     #                              RELOAD COMMAND                            #
@@ -324,18 +488,23 @@ class Commands:
         if program_name and program_name.lower() == 'all':
             program_name = None
 
-        if cmd == 'start':
-            return self.start_command(programs or self.programs, program_name)
-        if cmd == 'stop':
-            return self.stop_command(programs or self.programs, program_name)
-        if cmd == 'restart':
-            return self.restart_command(program_name)
         if cmd == 'status':
-            return self.status_command(programs or self.programs)
+            return encode(cmd, self.status_command(programs or self.programs))
         if cmd == 'help':
-            return self.help()
-        if cmd == 'reload':
-            return self.reload_command(program_name=program_name, config_path=config_path)
-        
-
-        return f"ERROR: unknown command '{command}'"
+            return encode(cmd, self.help())
+        if cmd == 'tail':
+            return encode(cmd, self.tail_command(program_name))
+        if cmd == 'metrics':
+            return encode(cmd, {"output": self.metrics.render()})
+
+        with self.lock:
+            if cmd == 'start':
+                return encode(cmd, self.start_command(programs or self.programs, program_name))
+            if cmd == 'stop':
+                return encode(cmd, self.stop_command(programs or self.programs, program_name))
+            if cmd == 'restart':
+                return encode(cmd, self.restart_command(program_name))
+            if cmd == 'reload':
+                return encode(cmd, self.reload_command(program_name=program_name, config_path=config_path))
+
+        return encode(cmd, [message(f"ERROR: unknown command '{command}'", "error")])
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from helper import log_event
+
+
+class AlertState:
+    """Recent history of one (name, event) pair."""
+
+    def __init__(self):
+        self.recent = deque()
+        self.quiet_until = 0.0
+        self.quiet_level = 0
+        self.suppressed = 0
+        self.suppressed_since = 0.0
+        self.quiet_ended = 0.0
+        self.timer = None
+        self.email = None
+        self.last_message = None
+
+
+class AlertPolicy:
+    """Single entry point for events that go to the event log and by email.
+
+    Events are keyed by (name, event type). Up to BURST of them per WINDOW
+    seconds go through; the one that reaches BURST starts a quiet period
+    during which events are only counted. If any were, one summary
+    ("'worker_03' died 47 times in 10 min") is logged and mailed when the
+    quiet period ends. A key that keeps misbehaving gets quiet periods twice
+    as long each time, up to MAX_QUIET; one that stayed silent for a whole
+    quiet period starts over. The end of a quiet period is a scheduler timer.
+    """
+
+    BURST = 3
+    WINDOW = 60
+    BASE_QUIET = 60
+    MAX_QUIET = 3600
+    EVENT_VERBS = {
+        "PROCESS_DIED": "died unexpectedly",
+        "PROCESS_EXITED": "exited",
+        "PROCESS_RUNNING": "entered RUNNING",
+        "PROCESS_FATAL": "entered FATAL",
+    }
+
+    def __init__(self, email_alerter, scheduler):
+        self.email_alerter = email_alerter
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+        self.states = {}
+
+    def notify(self, name, event, message, subject=None, severity="INFO"):
+        """Log an event and, when subject is given, email it, unless the key is being quieted.
+
+        Returns True if the event was delivered, False if it was suppressed.
+        """
+        now = time.monotonic()
+        with self.lock:
+            state = self.states.setdefault((name, event), AlertState())
+            state.last_message = message
+            if subject is not None:
+                state.email = severity
+
+            if now < state.quiet_until:
+                if not state.suppressed:
+                    state.suppressed_since = now
+                state.suppressed += 1
+                return False
+
+            while state.recent and now - state.recent[0] > self.WINDOW:
+                state.recent.popleft()
+            state.recent.append(now)
+            if len(state.recent) >= self.BURST:
+                if state.quiet_ended and now - state.quiet_ended > self.BASE_QUIET * 2 ** state.quiet_level:
+                    # Calm for longer than the next quiet period would last: start over.
+                    state.quiet_level = 0
+                quiet = min(self.BASE_QUIET * 2 ** state.quiet_level, self.MAX_QUIET)
+                state.quiet_level += 1
+                state.quiet_until = now + quiet
+                state.suppressed = 0
+                state.recent.clear()
+                state.timer = self.scheduler.call_later(quiet, self._end_quiet, name, event)
+
+        self._deliver(name, event, message, subject, severity)
+        return True
+
+    def _end_quiet(self, name, event):
+        with self.lock:
+            state = self.states.get((name, event))
+            if state is None:
+                return
+            count, since = state.suppressed, state.suppressed_since
+            email, last_message = state.email, state.last_message
+            state.suppressed = 0
+            state.quiet_until = 0.0
+            state.quiet_ended = time.monotonic()
+            state.timer = None
+            if not count:
+                state.quiet_level = 0
+                return
+
+        verb = self.EVENT_VERBS.get(event, event)
+        summary = f"'{name}' {verb} {count} times in {self._format_duration(time.monotonic() - since)}"
+        log_event(event, f"{summary} (last: {last_message})", name=name, suppressed=count, summary=True)
+        if email is not None:
+            self.email_alerter.send_alert(subject=summary, message=f"{summary}. Last event: {last_message}",
+                                          severity=email)
+
+    def _deliver(self, name, event, message, subject, severity):
+        log_event(event, message, name=name)
+        if subject is not None:
+            self.email_alerter.send_alert(subject=subject, message=message, severity=severity)
+
+    def forget(self, name):
+        """Drop the history of an instance that no longer exists."""
+        with self.lock:
+            for key in [key for key in self.states if key[0] == name]:
+                state = self.states.pop(key)
+                if state.timer is not None:
+                    state.timer.cancel()
+
+    @staticmethod
+    def _format_duration(seconds):
+        if seconds < 120:
+            return f"{int(seconds)} s"
+        if seconds < 7200:
+            return f"{int(seconds // 60)} min"
+        return f"{seconds / 3600:.1f} h"
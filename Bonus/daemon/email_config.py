@@ -17,5 +17,7 @@ def get_email_config():
         'smtp_port': int(config['smtp_port']),
         'username': config['username'],
         'password': config['password'],
-        'recipients': [config['recipients']] 
+        'recipients': [config['recipients']],
+        'digest_window': float(config.get('digest_window', 10)),
+        'smtp_ssl': config.get('smtp_ssl', 'true').lower() != 'false'
     }
\ No newline at end of file
@@ -3,6 +3,12 @@ import sys
 import time
 import signal
 import shutil
+import select
+from pty_hub import hub as pty_hub
+from log_writer import DEFAULT_MAXBYTES, DEFAULT_BACKUPS
+from event_log import EventLog
+
+event_log = EventLog(os.path.join("..", "logger", "taskmaster.jsonl"))
 
 
 
@@ -13,7 +19,27 @@ def get_path(path):
     return _expanded.replace("$PWD", os.getcwd())
 
 
-def exec_child_process(program, program_name, is_attach):
+def log_limits(program, stream):
+    """The (maxbytes, backups, maxage) rotation limits of a program's 'stdout' or 'stderr' log."""
+    return (
+        program.get(f'{stream}_logfile_maxbytes', DEFAULT_MAXBYTES),
+        program.get(f'{stream}_logfile_backups', DEFAULT_BACKUPS),
+        program.get(f'{stream}_logfile_maxage', 0)
+    )
+
+
+def program_log(program, stream):
+    """Return the shared RotatingFile for a program's 'stdout' or 'stderr', or None if not configured.
+
+    The caller owns one reference to it; the PTY hub drops it when the stream closes.
+    """
+    path = get_path(program.get(stream))
+    if not path:
+        return None
+    return pty_hub.open_log(path, *log_limits(program, stream))
+
+
+def exec_child_process(program, program_name, is_attach, stderr_fd=None):
     """Execute the child process. This runs in the child after fork."""
     try:
 
@@ -44,21 +70,13 @@ def exec_child_process(program, program_name, is_attach):
         workingdir = get_path(program.get('workingdir')) or os.getcwd()
         umask = program.get('umask', 0o022)
         os.umask(umask)
-        stdout_path = program.get('stdout')
-        print(f"DEBUG: is_attach = {is_attach}", file=sys.stderr )
-        if  not is_attach:
-            if stdout_path:
-                try:
-                    sys.stdout.flush()
-                    fd_out = os.open(stdout_path, os.O_WRONLY |
-                                    os.O_CREAT | os.O_APPEND, 0o666)
-                    os.dup2(fd_out, sys.stdout.fileno())
-                    os.close(fd_out)
-                except Exception as e:
-                    print(
-                        f"INFO Error: can't redirect stdout to '{stdout_path}': {e}", file=sys.stderr)
-                    sys.exit(1)
-
+        # stdout stays on the PTY: the daemon drains it into the 'stdout' log
+        # and to attached clients, so attaching never needs a restart.
+        # stderr goes to a pipe the daemon owns and rotates when one is given.
+        if stderr_fd is not None:
+            os.dup2(stderr_fd, sys.stderr.fileno())
+            os.close(stderr_fd)
+        elif not is_attach:
             stderr_path = program.get('stderr')
             if stderr_path:
                 try:
@@ -94,8 +112,8 @@ def exec_child_process(program, program_name, is_attach):
         sys.exit(1)
 
 
-def cleanup_failed_process(program_name, pid, running_processes, process_info):
-    """Update process state to STOPPED when it fails."""
+def cleanup_failed_process(program_name, pid, running_processes, process_info, state="STOPPED"):
+    """Update process state (STOPPED by default) when it fails."""
     try:
         try:
             os.waitpid(pid, os.WNOHANG)
@@ -107,18 +125,12 @@ def cleanup_failed_process(program_name, pid, running_processes, process_info):
                 running_processes[program_name].remove(pid)
 
         # Find and update the process state, close master_fd if exists
-        for key, info in process_info.items():
-            if info.get('pid') == pid:
-                info['state'] = 'STOPPED'
-                # Close master_fd if it exists
-                master_fd = info.get('master_fd')
-                if master_fd:
-                    try:
-                        os.close(master_fd)
-                    except:
-                        pass
-                    info['master_fd'] = None
-                break
+        key = process_info.find_pid(pid)
+        if key is not None:
+            master_fd = process_info[key].get('master_fd')
+            if master_fd:
+                pty_hub.release(master_fd)
+            process_info.update(key, state=state, master_fd=None)
 
     except Exception as e:
         print(f"Warning: Error during cleanup of process {pid}: {e}")
@@ -128,63 +140,114 @@ def cleanup_program(program_name, running_processes, process_info):
     """Update process state to FATAL and clean up running processes."""
     try:
         if program_name in running_processes:
-            for pid in list(running_processes[program_name]):
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                    time.sleep(0.5)
-                    try:
-                        os.kill(pid, signal.SIGKILL)
-                    except:
-                        pass
-                    os.waitpid(pid, os.WNOHANG)
-                except:
-                    pass
-
+            stop_process_group([(pid, signal.SIGTERM, 0.5)
+                                for pid in running_processes[program_name]])
             running_processes[program_name] = []
 
         # Update process state to FATAL and close master_fds
-        for key in list(process_info.keys()):
-            if key.startswith(f"{program_name}_") or key == program_name:
-                process_info[key]["state"] = "FATAL"
-                # Close master_fd if it exists
-                master_fd = process_info[key].get('master_fd')
-                if master_fd:
-                    try:
-                        os.close(master_fd)
-                    except:
-                        pass
-                    process_info[key]['master_fd'] = None
+        for key in process_info.instances(program_name):
+            # Close master_fd if it exists
+            master_fd = process_info[key].get('master_fd')
+            if master_fd:
+                pty_hub.release(master_fd)
+            process_info.update(key, state="FATAL", master_fd=None)
 
     except Exception as e:
         print(
             f"Warning: Error during program cleanup for '{program_name}': {e}")
 
 
-def stop_process(pid, stopsignal, stoptime):
-    """Stop a specific process with given signal and timeout."""
+def resolve_signal(stopsignal):
+    """Turn a signal name such as 'TERM' or 'SIGTERM' into a signal number."""
+    if isinstance(stopsignal, str):
+        return getattr(signal, f'SIG{stopsignal}', getattr(
+            signal, stopsignal, signal.SIGTERM))
+    return stopsignal
+
+
+def _open_pidfd(pid):
+    """Return a pidfd for pid, None if pidfds are unsupported, or raise ProcessLookupError."""
+    if not hasattr(os, 'pidfd_open'):
+        return None
     try:
-        if isinstance(stopsignal, str):
-            stopsignal = getattr(signal, f'SIG{stopsignal}', getattr(
-                signal, stopsignal, signal.SIGTERM))
-
-        os.kill(pid, stopsignal)
-        start_wait = time.time()
-        while True:
-            try:
-                os.kill(pid, 0)
-                if time.time() - start_wait > stoptime:
-                    try:
-                        os.kill(pid, signal.SIGKILL)
-                    except Exception:
-                        pass
-                    break
-                time.sleep(0.1)
-            except ProcessLookupError:
-                break
+        return os.pidfd_open(pid)
     except ProcessLookupError:
-        pass
-    except PermissionError:
-        pass
+        raise
+    except OSError:
+        return None
+
+
+def stop_process_group(targets):
+    """Stop many processes at once.
+
+    targets is a list of (pid, stopsignal, stoptime). Every target is signalled
+    first, then all of them are waited on together through pidfds in a single
+    poll(); whatever is still alive at its own deadline gets SIGKILL. The whole
+    group therefore takes at most the longest stoptime. Returns the list of
+    pids that had to be killed.
+    """
+    now = time.monotonic()
+    deadlines = {}
+    pidfds = {}
+    poller = select.poll()
+
+    for pid, stopsignal, stoptime in targets:
+        try:
+            # Open the pidfd before signalling so a recycled pid can never be killed later.
+            pidfd = _open_pidfd(pid)
+        except ProcessLookupError:
+            continue
+        try:
+            os.kill(pid, resolve_signal(stopsignal))
+        except (ProcessLookupError, PermissionError):
+            if pidfd is not None:
+                os.close(pidfd)
+            continue
+        deadlines[pid] = now + stoptime
+        if pidfd is not None:
+            pidfds[pidfd] = pid
+            poller.register(pidfd, select.POLLIN)
+
+    polled = set(pidfds.values())
+    fallback = [pid for pid in deadlines if pid not in polled]
+    killed = []
+    try:
+        while deadlines:
+            now = time.monotonic()
+            for pid in [p for p, deadline in deadlines.items() if deadline <= now]:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                    killed.append(pid)
+                except (ProcessLookupError, PermissionError):
+                    pass
+                del deadlines[pid]
+            if not deadlines:
+                break
+
+            timeout = min(deadlines.values()) - now
+            if fallback:
+                # Without pidfds the only option left is checking liveness now and then.
+                timeout = min(timeout, 0.1)
+            for fd, _event in poller.poll(max(timeout, 0) * 1000):
+                poller.unregister(fd)
+                deadlines.pop(pidfds[fd], None)
+
+            for pid in list(fallback):
+                try:
+                    os.kill(pid, 0)
+                except ProcessLookupError:
+                    fallback.remove(pid)
+                    deadlines.pop(pid, None)
+    finally:
+        for pidfd in pidfds:
+            os.close(pidfd)
+
+    return killed
+
+
+def stop_process(pid, stopsignal, stoptime):
+    """Stop a specific process with given signal and timeout."""
+    stop_process_group([(pid, stopsignal, stoptime)])
 
 
 def should_autorestart(autorestart_value):
@@ -199,6 +262,18 @@ def should_autorestart(autorestart_value):
     return bool(autorestart_value)
 
 
+def restart_on_exit(autorestart_value, exit_code, exitcodes):
+    """Whether an instance that exited on its own once RUNNING must be started again."""
+    if isinstance(autorestart_value, str):
+        val = autorestart_value.lower()
+        if val == "always":
+            return True
+        elif val == "unexpected":
+            return exit_code not in exitcodes
+        return False
+    return bool(autorestart_value)
+
+
 def run_process(program, indexed_name,is_attach=False):
     """Fork and exec a program, returning the child PID."""
     pid = os.fork()
@@ -212,16 +287,21 @@ def run_process(program, indexed_name,is_attach=False):
     return pid
 
 
+def decode_wait_status(exit_status):
+    """Turn a waitpid() status into an exit code (negative signal number if killed)."""
+    if os.WIFEXITED(exit_status):
+        return os.WEXITSTATUS(exit_status)
+    elif os.WIFSIGNALED(exit_status):
+        return -os.WTERMSIG(exit_status)
+    return -1
+
+
 def isalive_process(pid):
     """Return (alive: bool, exit_code: int or None)."""
     try:
         pid_result, exit_status = os.waitpid(pid, os.WNOHANG)
         if pid_result != 0:
-            if os.WIFEXITED(exit_status):
-                return False, os.WEXITSTATUS(exit_status)
-            elif os.WIFSIGNALED(exit_status):
-                return False, -os.WTERMSIG(exit_status)
-            return False, -1
+            return False, decode_wait_status(exit_status)
         os.kill(pid, 0)
         return True, None
     except ProcessLookupError:
@@ -230,35 +310,17 @@ def isalive_process(pid):
         return False, None
 
 
-def register_process(running_processes, process_info, program_name, indexed_name, pid, retry_count, state="RUNNING", master_fd=None):
+def register_process(running_processes, process_info, program_name, indexed_name, pid, retry_count, state="RUNNING", master_fd=None,
+                     generation=0):
     """Record process details with optional PTY master file descriptor."""
     if program_name not in running_processes:
         running_processes[program_name] = []
     if pid not in running_processes[program_name]:
         running_processes[program_name].append(pid)
 
-    process_info[indexed_name] = {
-        "retries": retry_count,
-        "start_time": time.time(),
-        "pid": pid,
-        "state": state,
-        "program_name": program_name,
-        "master_fd": master_fd
-    }
-
+    process_info.register(indexed_name, program_name, pid, retry_count, state, master_fd, time.time(), generation)
 
-def log_event(event_type, message):
-    """Log events to a file with timestamp."""
-    import datetime
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {event_type}: {message}\n"
 
-    log_dir = "../logger"
-    os.makedirs(log_dir, exist_ok=True)
-
-    log_file = os.path.join(log_dir, "taskmaster.log")
-    try:
-        with open(log_file, 'a') as f:
-            f.write(log_entry)
-    except Exception as e:
-        print(f"Warning: Could not write to log file: {e}")
+def log_event(event_type, message, **fields):
+    """Record a daemon event in the buffered JSONL event log."""
+    event_log.log(event_type, message, **fields)
@@ -1,19 +1,33 @@
 #!/usr/bin/env python3
-from server import TaskmasterCtlServer
-from Commands import Commands
-from helper import log_event
 import os
 import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from server import TaskmasterCtlServer
+from Commands import Commands
+from helper import event_log
+from event_log import FSYNC_MODES
+from proc_sampler import ProcSampler
+from metrics import start_http_server
 from termcolor import colored
 import argparse
 import pwd
 import signal
 import socket  # ADD THIS IMPORT
+import functools
+import time
 from ParseConfige import ConfigParser
+from reply import encode, message
 
 commands = None
 
 
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a number of at least 1, got {value}")
+    return number
+
+
 def argsparser():
     parser = argparse.ArgumentParser(description="Task Master CLI")
     parser.add_argument(
@@ -24,6 +38,22 @@ def argsparser():
         '-d', '--daemon', action='store_true',
         help='Run in daemon mode (background)'
     )
+    parser.add_argument(
+        '--event-log-fsync', choices=FSYNC_MODES, default='never',
+        help='When to fsync the event log: never, after each batch, or after every event'
+    )
+    parser.add_argument(
+        '--max-parallel-starts', type=positive_int, default=Commands.DEFAULT_MAX_PARALLEL_STARTS,
+        help='Maximum number of program instances started concurrently'
+    )
+    parser.add_argument(
+        '--sample-interval', type=float, default=ProcSampler.DEFAULT_INTERVAL,
+        help='Seconds between two reads of /proc for the supervised processes'
+    )
+    parser.add_argument(
+        '--metrics-port', type=int, default=None,
+        help='Also serve the metrics over HTTP on 127.0.0.1:<port>/metrics'
+    )
     args = parser.parse_args()
     return args
 
@@ -50,118 +80,115 @@ def load_configuration(config_path):
     return programs
 
 
-def initialize_commands(programs):
+def initialize_commands(programs, max_parallel_starts=Commands.DEFAULT_MAX_PARALLEL_STARTS,
+                        sample_interval=ProcSampler.DEFAULT_INTERVAL, metrics_port=None):
     global commands
-    commands = Commands(programs, running_processes={})
+    commands = Commands(programs, running_processes={}, max_parallel_starts=max_parallel_starts,
+                        sample_interval=sample_interval)
+    commands.reaper.install()
+    commands.sampler.start()
+    if metrics_port:
+        start_http_server(commands.metrics, port=metrics_port)
+        print(f"Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
     print("taskmasterd Started with PID:", os.getpid())
-    log_event("DAEMON_START", f"Taskmaster daemon started with PID {os.getpid()}")
-    commands.email_alerter.send_alert(
+    commands.alerts.notify(
+        "taskmasterd", "DAEMON_START",
+        f"Taskmaster daemon successfully started with PID {os.getpid()}",
         subject="Taskmaster Daemon Started",
-        message=f"Taskmaster daemon successfully started with PID {os.getpid()}",
         severity="INFO"
     )
 
 
-def start_autostart_programs(programs, config_path):
+def start_autostart_programs(programs):
+    """Start every autostart program together, through the same parallel path as `start all`."""
     global commands
+    autostart_programs = {}
     for prgm in programs:
         commands.running_processes[prgm] = []
         autostart = programs[prgm].get('autostart', False)
         if autostart is True or (isinstance(autostart, str) and autostart.lower() == 'true'):
-            commands.process_command('start', prgm, programs, config_path)
+            autostart_programs[prgm] = programs[prgm]
+    if autostart_programs:
+        commands.start_command(autostart_programs)
 
 
-def handle_client_connection(server, client_socket, programs, config_path):
-    """Handle a single client connection"""
+def handle_client_request(server, connection, request_id, command, program_name, programs, config_path):
+    """Serve a single request on a worker thread.
+
+    Returns True to keep the connection open for further requests.
+    """
     global commands
-    should_exit = False
-    
+
     try:
-        while True:
-            command, program_name, _ = server.handle_client(client_socket)
-            
-            if command is None:
-                break
-            
-            if command == "attach":
-                response = commands.verify_attach(program_name)
-                commands.stop_command(commands.programs, program_name)
-                commands.start_command(commands.programs, program_name, True)
-                try:
-                    client_socket.sendall(response.encode('utf-8'))
-                except (BrokenPipeError, socket.error):
-                    break
-                
-                if response.startswith("ATTACH_OK"):
-                    commands.handle_attached_session(program_name, client_socket)
-                    break
-                continue
-            
-            elif command == "detach":
-                response = commands.detach_command(program_name)
-                try:
-                    client_socket.sendall(response.encode('utf-8'))
-                except Exception:
-                    pass
-                break
-            
+        if command == "attach" or (command == "tail" and "-f" in (program_name or "").split()):
+            # Attach to the PTY the instance already has; the process is never restarted.
+            # `tail -f` is a read-only attach that replays the requested number of lines.
+            default_lines = commands.ATTACH_REPLAY_LINES if command == "attach" else commands.TAIL_LINES
+            try:
+                program_name, lines, _, readonly = commands.parse_output_args(program_name, default_lines)
+            except ValueError:
+                connection.send_reply(request_id, encode(command, [message("Error: -n expects a number of lines",
+                                                                           "error")]))
+                return True
+            readonly = readonly or command == "tail"
+            errors = commands.verify_attach(program_name)
+            if errors:
+                connection.send_reply(request_id, encode(command, errors))
             else:
-                response = commands.process_command(command, program_name, programs, config_path)
-                
-                if response is None:
-                    if command.lower() == 'exit':
-                        should_exit = True
-                        break
-                    continue
-                
-                try:
-                    client_socket.sendall(response.encode('utf-8'))
-                except (BrokenPipeError, socket.error):
-                    break
-                
-                if command.lower() == 'exit':
-                    should_exit = True
-                    break
-    
+                commands.handle_attached_session(program_name, connection, request_id, readonly, lines, command)
+            return True
+
+        elif command == "status" and "--watch" in (program_name or "").split():
+            commands.handle_watch_session(program_name, connection, request_id)
+            return True
+
+        elif command == "detach":
+            connection.send_reply(request_id, encode(command, commands.detach_command(program_name)))
+            return True
+
+        started = time.monotonic()
+        response = commands.process_command(command, program_name, programs, config_path)
+        label = command.lower() if command.lower() in Commands.VALID_CMDS else "unknown"
+        commands.metrics.observe_command(label, time.monotonic() - started)
+
+        if response is None:
+            response = ""
+        connection.send_reply(request_id, response)
+
+        if command.lower() == 'exit':
+            server.shutdown()
+            return False
+        return True
+
+    except (BrokenPipeError, socket.error):
+        return False
     except Exception as e:
         print(f"{e}")
-    finally:
-        try:
-            client_socket.close()
-        except:
-            pass
-    
-    return should_exit
+        return False
 
 
 def run_server_loop(server, programs, config_path):
-    should_exit = False
-    
-    while not should_exit:
-        client_socket = server.accept_connection()
-        if client_socket is None:
-            continue
-        should_exit = handle_client_connection(server, client_socket, programs, config_path)
+    server.serve_forever(functools.partial(
+        handle_client_request, server, programs=programs, config_path=config_path))
+    server.stop()
 
 
 def shutdown_daemon(reason):
     global commands
     if commands:
-        log_event("DAEMON_SHUTDOWN", reason)
-        commands.email_alerter.send_alert(
-            subject="Taskmaster Daemon Shutdown",
-            message=reason,
-            severity="WARNING"
-        )
+        commands.alerts.notify("taskmasterd", "DAEMON_SHUTDOWN", reason,
+                               subject="Taskmaster Daemon Shutdown", severity="WARNING")
+        event_log.flush()
+        commands.email_alerter.close()
 
 
 def log_daemon_error(error):
     global commands
     if commands:
-        log_event("DAEMON_ERROR", f"Taskmaster daemon error: {error}")
-        commands.email_alerter.send_alert(
+        commands.alerts.notify(
+            "taskmasterd", "DAEMON_ERROR",
+            f"Taskmaster daemon encountered an error: {error}",
             subject="Taskmaster Daemon Error",
-            message=f"Taskmaster daemon encountered an error: {error}",
             severity="CRITICAL"
         )
 
@@ -188,13 +215,14 @@ def main():
     
     try:
         args = argsparser()
+        event_log.fsync = args.event_log_fsync
         server = initialize_server()
         drop_privileges('nobody') 
         signal.signal(signal.SIGINT, _sigint_handler)
         
         programs = load_configuration(args.config)
-        initialize_commands(programs)
-        start_autostart_programs(programs, args.config)
+        initialize_commands(programs, args.max_parallel_starts, args.sample_interval, args.metrics_port)
+        start_autostart_programs(programs)
         run_server_loop(server, programs, args.config)
         
         print("Taskmaster daemon shutting down gracefully...")
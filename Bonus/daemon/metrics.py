@@ -0,0 +1,198 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class LatencyHistogram:
+    """Cumulative Prometheus histogram of durations, in seconds."""
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def snapshot(self):
+        copy = LatencyHistogram()
+        copy.counts = list(self.counts)
+        copy.total = self.total
+        return copy
+
+    def lines(self, name, **labels):
+        cumulative = 0
+        for bound, count in zip(self.BUCKETS + ("+Inf",), self.counts):
+            cumulative += count
+            yield f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}"
+        yield f"{name}_sum{_labels(**labels)} {self.total:.6f}"
+        yield f"{name}_count{_labels(**labels)} {cumulative}"
+
+
+class Metrics:
+    """Counters kept by the daemon and the Prometheus text rendering of them.
+
+    Restart counts and time spent in each state come from the process table's
+    state changes; CPU, RSS and open fds come from the sampler's cache, so
+    rendering never reads /proc.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, process_table, sampler):
+        self.process_table = process_table
+        self.sampler = sampler
+        self.lock = threading.Lock()
+        self.restarts = {}
+        self.state_since = {}
+        self.state_seconds = {}
+        self.command_latency = {}
+
+    def on_state_change(self, indexed_name, old_state, record):
+        """ProcessTable listener: count restarts and accumulate time per state."""
+        now = time.monotonic()
+        with self.lock:
+            if record.state == 'STARTING' and old_state is not None:
+                self.restarts[indexed_name] = self.restarts.get(indexed_name, 0) + 1
+            previous = self.state_since.get(indexed_name)
+            if previous is not None:
+                state, since = previous
+                totals = self.state_seconds.setdefault(indexed_name, {})
+                totals[state] = totals.get(state, 0.0) + now - since
+            self.state_since[indexed_name] = (record.state, now)
+
+    def forget(self, indexed_name):
+        """Drop the counters of an instance that no longer exists."""
+        with self.lock:
+            self.restarts.pop(indexed_name, None)
+            self.state_since.pop(indexed_name, None)
+            self.state_seconds.pop(indexed_name, None)
+
+    def replace(self, indexed_name, replacement):
+        """An instance was replaced by one started under another name, which now takes its name.
+
+        The replacement's counters are added to the instance's and count as
+        one more restart, so the series of the name stays monotonic.
+        """
+        with self.lock:
+            restarts = self.restarts.pop(replacement, 0)
+            self.restarts[indexed_name] = self.restarts.get(indexed_name, 0) + restarts + 1
+            totals = self.state_seconds.setdefault(indexed_name, {})
+            previous = self.state_since.pop(indexed_name, None)
+            if previous is not None:
+                state, since = previous
+                totals[state] = totals.get(state, 0.0) + time.monotonic() - since
+            for state, seconds in self.state_seconds.pop(replacement, {}).items():
+                totals[state] = totals.get(state, 0.0) + seconds
+            if replacement in self.state_since:
+                self.state_since[indexed_name] = self.state_since.pop(replacement)
+
+    def observe_command(self, command, seconds):
+        """Record how long the daemon took to serve one control command."""
+        with self.lock:
+            histogram = self.command_latency.get(command)
+            if histogram is None:
+                histogram = self.command_latency[command] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def render(self):
+        """The whole exposition, in Prometheus text format."""
+        now = time.time()
+        monotonic_now = time.monotonic()
+        families = {
+            "taskmaster_instance_up": ("gauge", "1 if the instance is RUNNING", []),
+            "taskmaster_instance_state": ("gauge", "Current state of the instance", []),
+            "taskmaster_instance_uptime_seconds": ("gauge", "Seconds since the instance was started", []),
+            "taskmaster_instance_restarts_total": ("counter", "Times the instance was started again", []),
+            "taskmaster_instance_last_exit_code": ("gauge", "Exit code of the last exit of the instance", []),
+            "taskmaster_instance_state_seconds_total": ("counter", "Seconds spent in each state", []),
+            "taskmaster_instance_cpu_seconds_total": ("counter", "User and system CPU time, from the last sample", []),
+            "taskmaster_instance_resident_memory_bytes": ("gauge", "Resident set size, from the last sample", []),
+            "taskmaster_instance_open_fds": ("gauge", "Open file descriptors, from the last sample", []),
+        }
+
+        with self.lock:
+            restarts = dict(self.restarts)
+            state_since = dict(self.state_since)
+            state_seconds = {name: dict(totals) for name, totals in self.state_seconds.items()}
+            command_latency = {command: h.snapshot() for command, h in self.command_latency.items()}
+
+        for indexed_name, info in sorted(self.process_table.items()):
+            labels = _labels(name=indexed_name, program=info.program_name)
+            running = info.state == 'RUNNING'
+            families["taskmaster_instance_up"][2].append(f"{labels} {int(running)}")
+            families["taskmaster_instance_state"][2].append(
+                f"{_labels(name=indexed_name, program=info.program_name, state=info.state)} 1")
+            if running and info.start_time:
+                families["taskmaster_instance_uptime_seconds"][2].append(f"{labels} {now - info.start_time:.3f}")
+            families["taskmaster_instance_restarts_total"][2].append(f"{labels} {restarts.get(indexed_name, 0)}")
+            if info.exit_code is not None:
+                families["taskmaster_instance_last_exit_code"][2].append(f"{labels} {info.exit_code}")
+
+            totals = state_seconds.get(indexed_name, {})
+            if indexed_name in state_since:
+                state, since = state_since[indexed_name]
+                totals[state] = totals.get(state, 0.0) + monotonic_now - since
+            for state, seconds in sorted(totals.items()):
+                families["taskmaster_instance_state_seconds_total"][2].append(
+                    f"{_labels(name=indexed_name, program=info.program_name, state=state)} {seconds:.3f}")
+
+            sample = self.sampler.get(indexed_name)
+            if sample is not None and sample.pid == info.pid:
+                families["taskmaster_instance_cpu_seconds_total"][2].append(f"{labels} {sample.cpu_seconds:.2f}")
+                families["taskmaster_instance_resident_memory_bytes"][2].append(f"{labels} {sample.rss_bytes}")
+                families["taskmaster_instance_open_fds"][2].append(f"{labels} {sample.open_fds}")
+
+        out = []
+        for name, (kind, help_text, samples) in families.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(f"{name}{sample}" for sample in samples)
+
+        out.append("# HELP taskmaster_command_duration_seconds Time taskmasterd took to serve a control command")
+        out.append("# TYPE taskmaster_command_duration_seconds histogram")
+        for command, histogram in sorted(command_latency.items()):
+            out.extend(histogram.lines("taskmaster_command_duration_seconds", command=command))
+
+        out.append("# HELP taskmaster_sampler_duration_seconds Duration of the last /proc sampling pass")
+        out.append("# TYPE taskmaster_sampler_duration_seconds gauge")
+        out.append(f"taskmaster_sampler_duration_seconds {self.sampler.last_duration:.6f}")
+        out.append("# HELP taskmaster_sampler_last_run_timestamp_seconds When /proc was last sampled")
+        out.append("# TYPE taskmaster_sampler_last_run_timestamp_seconds gauge")
+        out.append(f"taskmaster_sampler_last_run_timestamp_seconds {self.sampler.last_run:.3f}")
+        return "\n".join(out) + "\n"
+
+
+def start_http_server(metrics, host="127.0.0.1", port=9101):
+    """Serve metrics.render() on http://host:port/metrics from a background thread."""
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", Metrics.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
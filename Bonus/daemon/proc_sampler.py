@@ -0,0 +1,185 @@
+import os
+import resource
+import threading
+import time
+from array import array
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+READ_SIZE = 4096
+
+
+def _fd_dir_counts():
+    """Since Linux 6.2, stat() on /proc/<pid>/fd reports the number of open fds as its size."""
+    try:
+        return os.stat("/proc/self/fd").st_size > 0
+    except OSError:
+        return False
+
+
+class ProcSample:
+    """Resource usage of one instance, as read from /proc at `time`."""
+
+    __slots__ = ('pid', 'cpu_seconds', 'rss_bytes', 'open_fds', 'time')
+
+    def __init__(self, pid, cpu_seconds, rss_bytes, open_fds, sampled_at):
+        self.pid = pid
+        self.cpu_seconds = cpu_seconds
+        self.rss_bytes = rss_bytes
+        self.open_fds = open_fds
+        self.time = sampled_at
+
+
+class ProcSampler:
+    """Background thread that samples /proc for every supervised pid each `interval` seconds.
+
+    Every instance gets a slot in preallocated arrays (pid, CPU seconds, RSS,
+    open fds, sample time). The stat and statm files of a pid are opened once
+    and re-read with os.pread on each pass, so a pass costs two reads and one
+    stat() per instance instead of opening, reading and closing files. Status,
+    metrics and anything else that needs resource usage read the arrays and
+    never touch /proc themselves.
+
+    Kept-open files use at most a quarter of RLIMIT_NOFILE; instances
+    beyond that are read with a plain open/pread/close.
+    """
+
+    DEFAULT_INTERVAL = 5.0
+    INITIAL_SLOTS = 256
+
+    def __init__(self, process_table, interval=DEFAULT_INTERVAL, capacity=INITIAL_SLOTS):
+        self.process_table = process_table
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.free_slots = []
+        self.open_files = {}
+        self.capacity = 0
+        self.pids = array('l')
+        self.cpu_seconds = array('d')
+        self.rss_bytes = array('q')
+        self.open_fds = array('l')
+        self.sampled_at = array('d')
+        self._grow(capacity)
+        self.fd_dir_counts = _fd_dir_counts()
+        self.max_open_pids = resource.getrlimit(resource.RLIMIT_NOFILE)[0] // 8
+        self.last_duration = 0.0
+        self.last_run = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, name="proc-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get(self, indexed_name):
+        """Latest sample of an instance, or None if it has not been sampled while running."""
+        with self.lock:
+            slot = self.slots.get(indexed_name)
+            if slot is None or not self.sampled_at[slot]:
+                return None
+            return ProcSample(self.pids[slot], self.cpu_seconds[slot], self.rss_bytes[slot],
+                              self.open_fds[slot], self.sampled_at[slot])
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            self.sample_all()
+            self.stop_event.wait(self.interval)
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.pids.extend([0] * extra)
+        self.cpu_seconds.extend([0.0] * extra)
+        self.rss_bytes.extend([0] * extra)
+        self.open_fds.extend([0] * extra)
+        self.sampled_at.extend([0.0] * extra)
+        self.free_slots.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def _assign_slots(self, running):
+        """Give a slot to every running instance and free the slots of the others."""
+        with self.lock:
+            for indexed_name in [name for name in self.slots if name not in running]:
+                slot = self.slots.pop(indexed_name)
+                self._close_files(slot)
+                self.pids[slot] = 0
+                self.sampled_at[slot] = 0.0
+                self.free_slots.append(slot)
+            for indexed_name in running:
+                if indexed_name not in self.slots:
+                    if not self.free_slots:
+                        self._grow(self.capacity * 2)
+                    self.slots[indexed_name] = self.free_slots.pop()
+
+    def _open_files(self, slot, pid):
+        self._close_files(slot)
+        stat_fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            statm_fd = os.open(f"/proc/{pid}/statm", os.O_RDONLY | os.O_CLOEXEC)
+        except OSError:
+            os.close(stat_fd)
+            raise
+        self.open_files[slot] = (pid, stat_fd, statm_fd)
+        return stat_fd, statm_fd
+
+    def _close_files(self, slot):
+        files = self.open_files.pop(slot, None)
+        if files is not None:
+            os.close(files[1])
+            os.close(files[2])
+
+    def _read(self, slot, pid):
+        """Raw stat and statm contents plus the fd count of pid, or None if it is gone."""
+        files = self.open_files.get(slot)
+        try:
+            if files is not None and files[0] == pid:
+                _, stat_fd, statm_fd = files
+            elif files is not None or len(self.open_files) < self.max_open_pids:
+                stat_fd, statm_fd = self._open_files(slot, pid)
+            else:
+                stat_fd = statm_fd = None
+            if stat_fd is None:
+                with open(f"/proc/{pid}/stat", 'rb') as f:
+                    stat = f.read()
+                with open(f"/proc/{pid}/statm", 'rb') as f:
+                    statm = f.read()
+            else:
+                stat = os.pread(stat_fd, READ_SIZE, 0)
+                statm = os.pread(statm_fd, READ_SIZE, 0)
+            if self.fd_dir_counts:
+                open_fds = os.stat(f"/proc/{pid}/fd").st_size
+            else:
+                open_fds = len(os.listdir(f"/proc/{pid}/fd"))
+        except OSError:
+            # The process exited (ESRCH/ENOENT) or is not ours to read.
+            self._close_files(slot)
+            return None
+        return stat, statm, open_fds
+
+    def sample_all(self):
+        started = time.monotonic()
+        running = {name: info.pid for name, info in self.process_table.items() if info.pid}
+        self._assign_slots(running)
+
+        readings = []
+        for indexed_name, pid in running.items():
+            slot = self.slots[indexed_name]
+            reading = self._read(slot, pid)
+            if reading is not None:
+                readings.append((slot, pid, reading))
+
+        now = time.time()
+        with self.lock:
+            for slot, pid, (stat, statm, open_fds) in readings:
+                # The command name may contain spaces or ')'; fields start after the last ')'.
+                fields = stat[stat.rindex(b')') + 2:].split()
+                self.pids[slot] = pid
+                self.cpu_seconds[slot] = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+                self.rss_bytes[slot] = int(statm.split()[1]) * PAGE_SIZE
+                self.open_fds[slot] = open_fds
+                self.sampled_at[slot] = now
+        self.last_run = now
+        self.last_duration = time.monotonic() - started
@@ -0,0 +1,182 @@
+import threading
+
+
+class ProcessRecord:
+    """Runtime state of one instance.
+
+    Fixed __slots__ instead of a per-instance dict; reads like the dict it
+    replaces (record.get('pid'), record['state']). Change it only through
+    ProcessTable.update() so the indexes follow.
+    """
+
+    __slots__ = ('program_name', 'pid', 'state', 'retries', 'start_time',
+                 'master_fd', 'exit_code', 'attached', 'message', 'generation')
+
+    def __init__(self, program_name, pid, state, retries=0, start_time=None, master_fd=None, generation=0):
+        self.program_name = program_name
+        self.pid = pid
+        self.state = state
+        self.retries = retries
+        self.start_time = start_time
+        self.master_fd = master_fd
+        self.exit_code = None
+        self.attached = False
+        self.message = None
+        # Configuration generation of the program this instance was started from.
+        self.generation = generation
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __repr__(self):
+        fields = ", ".join(f"{key}={getattr(self, key)!r}" for key in self.__slots__)
+        return f"ProcessRecord({fields})"
+
+
+class ProcessTable:
+    """Registry of every supervised instance, indexed by program and by pid.
+
+    Reads work like the plain {indexed_name: info} dict it replaces. Every
+    change goes through register(), update() or remove(), which keep the
+    secondary indexes exact, so finding an instance by name, the instances
+    of a program or the owner of a pid costs the same with 5 instances as
+    with 5,000.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.records = {}
+        self.by_program = {}
+        self.by_pid = {}
+        self.listeners = []
+
+    def __contains__(self, indexed_name):
+        return indexed_name in self.records
+
+    def __getitem__(self, indexed_name):
+        return self.records[indexed_name]
+
+    def __iter__(self):
+        return iter(list(self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, indexed_name, default=None):
+        return self.records.get(indexed_name, default)
+
+    def keys(self):
+        return list(self.records)
+
+    def items(self):
+        return list(self.records.items())
+
+    def values(self):
+        return list(self.records.values())
+
+    def add_listener(self, callback):
+        """Register callback(indexed_name, old_state, record), called on every state change.
+
+        It runs with the table locked, so it must not block.
+        """
+        self.listeners.append(callback)
+
+    def _state_changed(self, indexed_name, old_state, info):
+        for listener in self.listeners:
+            try:
+                listener(indexed_name, old_state, info)
+            except Exception as e:
+                print(f"Warning: state listener failed for '{indexed_name}': {e}")
+
+    def register(self, indexed_name, program_name, pid, retries, state, master_fd=None, start_time=None,
+                 generation=0):
+        """Add or replace the record of an instance."""
+        with self.lock:
+            old = self.remove(indexed_name)
+            info = ProcessRecord(program_name, pid, state, retries, start_time, master_fd, generation)
+            self.records[indexed_name] = info
+            self.by_program.setdefault(program_name, {})[indexed_name] = None
+            if pid:
+                self.by_pid[pid] = indexed_name
+            old_state = old.state if old is not None else None
+            if old_state != state:
+                self._state_changed(indexed_name, old_state, info)
+            return info
+
+    def update(self, indexed_name, **fields):
+        """Change fields of an instance's record; returns the record, or None if unknown."""
+        with self.lock:
+            info = self.records.get(indexed_name)
+            if info is None:
+                return None
+            if 'pid' in fields and fields['pid'] != info.pid:
+                self._unindex_pid(indexed_name, info.pid)
+                if fields['pid']:
+                    self.by_pid[fields['pid']] = indexed_name
+            if 'program_name' in fields and fields['program_name'] != info.program_name:
+                self._unindex_program(indexed_name, info.program_name)
+                self.by_program.setdefault(fields['program_name'], {})[indexed_name] = None
+            old_state = info.state
+            for key, value in fields.items():
+                setattr(info, key, value)
+            if info.state != old_state:
+                self._state_changed(indexed_name, old_state, info)
+            return info
+
+    def remove(self, indexed_name):
+        """Forget an instance; returns its last record, or None if unknown."""
+        with self.lock:
+            info = self.records.pop(indexed_name, None)
+            if info is not None:
+                self._unindex_pid(indexed_name, info.pid)
+                self._unindex_program(indexed_name, info.program_name)
+            return info
+
+    def rename(self, old_name, new_name):
+        """Move an instance's record to another, unused name; returns the record.
+
+        Listeners see the new name appear (old state None) in its current state.
+        """
+        with self.lock:
+            if new_name in self.records:
+                raise KeyError(f"'{new_name}' is already registered")
+            info = self.remove(old_name)
+            if info is None:
+                raise KeyError(old_name)
+            self.records[new_name] = info
+            self.by_program.setdefault(info.program_name, {})[new_name] = None
+            if info.pid:
+                self.by_pid[info.pid] = new_name
+            self._state_changed(new_name, None, info)
+            return info
+
+    def instances(self, program_name):
+        """Names of a program's instances, sorted."""
+        with self.lock:
+            return sorted(self.by_program.get(program_name, ()))
+
+    def find_pid(self, pid):
+        """Name of the instance currently owning pid, or None."""
+        return self.by_pid.get(pid) if pid else None
+
+    def _unindex_pid(self, indexed_name, pid):
+        # A recycled pid may already belong to another instance; leave that mapping alone.
+        if pid and self.by_pid.get(pid) == indexed_name:
+            del self.by_pid[pid]
+
+    def _unindex_program(self, indexed_name, program_name):
+        names = self.by_program.get(program_name)
+        if names is not None:
+            names.pop(indexed_name, None)
+            if not names:
+                del self.by_program[program_name]
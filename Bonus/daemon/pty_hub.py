@@ -0,0 +1,452 @@
+import os
+import selectors
+import threading
+import time
+from collections import deque
+from scrollback import Scrollback
+from log_writer import RotatingFile
+
+
+class PtySubscriber:
+    """One attached client of a PTY, with its own bounded output queue.
+
+    The hub only appends to the queue; a dedicated sender thread drains it, so
+    a slow client can never stall the reader, the process or other viewers.
+    When the queue grows past max_queued_bytes the oldest output is dropped.
+    """
+
+    def __init__(self, stream, send, on_close, writable, max_queued_bytes):
+        self.stream = stream
+        self.send = send
+        self.on_close = on_close
+        self.writable = writable
+        self.max_queued_bytes = max_queued_bytes
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.dropped_bytes = 0
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def push(self, chunk):
+        with self.condition:
+            if self.closed:
+                return
+            self.queue.append(chunk)
+            self.queued_bytes += len(chunk)
+            while self.queued_bytes > self.max_queued_bytes and len(self.queue) > 1:
+                dropped = self.queue.popleft()
+                self.queued_bytes -= len(dropped)
+                self.dropped_bytes += len(dropped)
+            self.condition.notify()
+
+    def run(self):
+        """Sender thread: forward queued output, batching whatever piled up."""
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if not self.queue:
+                    break
+                chunks = list(self.queue)
+                self.queue.clear()
+                self.queued_bytes = 0
+            try:
+                self.send(b"".join(chunks) if len(chunks) > 1 else chunks[0])
+            except OSError:
+                self.stream.hub.unsubscribe(self)
+                break
+        self.on_close()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class PtyStream:
+    """One PTY master fd (or stderr pipe): its subscribers and the log its output is drained into."""
+
+    def __init__(self, hub, name, master_fd, log=None, scrollback=None, close_on_eof=False):
+        self.hub = hub
+        self.name = name
+        self.master_fd = master_fd
+        self.scrollback = scrollback
+        self.close_on_eof = close_on_eof
+        self.subscribers = []
+        self.writer = None
+        self.log = log
+        self.pending = bytearray()
+        # Keystrokes waiting for room in the terminal, written by the hub loop.
+        self.input = deque()
+        self.input_bytes = 0
+        self.input_dropped = 0
+
+    def record(self, chunk):
+        """Queue output for the log; it is written in batches by flush()."""
+        if self.log is not None:
+            self.pending += chunk
+
+    def flush(self):
+        if not self.pending:
+            return
+        data = bytes(self.pending).replace(b"\r\n", b"\n")
+        self.pending.clear()
+        try:
+            self.log.write(data)
+        except OSError as e:
+            print(f"Warning: Could not write output of '{self.name}' to {self.log.path}: {e}")
+
+    def close_log(self):
+        if self.log is not None:
+            self.flush()
+            self.hub.close_log(self.log)
+
+
+class PtyHub:
+    """Drain every supervised PTY from one thread and fan its output out.
+
+    Each PTY is read continuously from the moment its process is spawned, so
+    a child never blocks on a full terminal buffer whether or not anyone is
+    attached. Output is appended to the program's stdout log in batches and
+    copied to any number of attach subscribers; at most one of them (the
+    first to ask) may also type into the process. The daemon-owned stderr
+    pipes are drained by the same loop, so logs are written and rotated here
+    and never by the children.
+    """
+
+    READ_SIZE = 64 * 1024
+    SUBSCRIBER_QUEUE_BYTES = 256 * 1024
+    FLUSH_BYTES = 64 * 1024
+    FLUSH_INTERVAL = 0.5
+    DEFAULT_SCROLLBACK_BYTES = 64 * 1024
+    INPUT_QUEUE_BYTES = 64 * 1024
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.selector = selectors.DefaultSelector()
+        self.streams = {}
+        self.scrollbacks = {}
+        # path -> [RotatingFile, number of streams writing to it]
+        self.logs = {}
+        self.owned_fds = set()
+        self.thread = None
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        os.set_blocking(self.wakeup_write, False)
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ, None)
+
+    def _wakeup(self):
+        try:
+            os.write(self.wakeup_write, b"\0")
+        except BlockingIOError:
+            pass
+
+    def _ensure_thread(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name="pty-hub", daemon=True)
+            self.thread.start()
+
+    def adopt(self, master_fd, name=None, log=None, scrollback_bytes=DEFAULT_SCROLLBACK_BYTES,
+              close_on_eof=False):
+        """Take ownership of a freshly opened PTY master fd and start draining it.
+
+        Output goes to log (a RotatingFile, if any), to the instance's
+        scrollback and to subscribers; release() closes the fd. The scrollback
+        survives restarts of the instance, so the output of a crashed process
+        can still be read. Pipes nobody else refers to are adopted with
+        close_on_eof and closed by the hub itself once the writer goes away.
+        """
+        name = name or str(master_fd)
+        with self.lock:
+            self.owned_fds.add(master_fd)
+            os.set_blocking(master_fd, False)
+            scrollback = self.scrollbacks.get(name)
+            if scrollback is None or scrollback.size != scrollback_bytes:
+                scrollback = self.scrollbacks[name] = Scrollback(scrollback_bytes)
+            stream = PtyStream(self, name, master_fd, log, scrollback, close_on_eof)
+            self.streams[master_fd] = stream
+            self.selector.register(master_fd, selectors.EVENT_READ, stream)
+            self._ensure_thread()
+        self._wakeup()
+
+    def open_log(self, path, maxbytes, backups, maxage):
+        """The RotatingFile of path, shared by every stream that logs to it.
+
+        The instances of a program all log to the program's stdout/stderr
+        path, and only one RotatingFile may own a path, or their rotations
+        lose output. Each call takes a reference that close_log() drops; the
+        file is closed with the last one. The latest limits given apply.
+        """
+        key = os.path.abspath(path)
+        with self.lock:
+            entry = self.logs.get(key)
+            if entry is None:
+                entry = self.logs[key] = [RotatingFile(path, maxbytes, backups, maxage), 0]
+            else:
+                log = entry[0]
+                log.maxbytes, log.backups, log.maxage = maxbytes, backups, maxage
+            entry[1] += 1
+            return entry[0]
+
+    def set_log_limits(self, path, maxbytes, backups, maxage):
+        """Apply new rotation limits to the writer of path, if it is open."""
+        with self.lock:
+            entry = self.logs.get(os.path.abspath(path))
+            if entry is not None:
+                log = entry[0]
+                log.maxbytes, log.backups, log.maxage = maxbytes, backups, maxage
+
+    def close_log(self, log):
+        """Drop a reference taken by open_log()."""
+        with self.lock:
+            key = os.path.abspath(log.path)
+            entry = self.logs.get(key)
+            if entry is None or entry[0] is not log:
+                log.close()
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.logs[key]
+                log.close()
+
+    def subscribe(self, name, master_fd, send, on_close, readonly=False, replay_lines=0):
+        """Add a subscriber to the PTY of instance `name`.
+
+        send(data) delivers output to the client and on_close() runs once the
+        subscription ends, for whatever reason. The subscriber is writable only
+        if it did not ask to be read-only and nobody else holds the keyboard.
+        The last replay_lines lines of scrollback are sent first, with no gap
+        or overlap with the live output. Raises OSError if the terminal is
+        already closed.
+        """
+        with self.lock:
+            stream = self.streams.get(master_fd)
+            if stream is None:
+                raise OSError(f"terminal of '{name}' is closed")
+            writable = not readonly and stream.writer is None
+            subscriber = PtySubscriber(stream, send, on_close, writable, self.SUBSCRIBER_QUEUE_BYTES)
+            if writable:
+                stream.writer = subscriber
+            if replay_lines and stream.scrollback:
+                history = stream.scrollback.last_lines(replay_lines)
+                if history:
+                    subscriber.push(history)
+            stream.subscribers.append(subscriber)
+
+        threading.Thread(target=subscriber.run, name=f"pty-{name}", daemon=True).start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """End a subscription; the PTY keeps being drained into its log."""
+        with self.lock:
+            stream = subscriber.stream
+            if subscriber in stream.subscribers:
+                stream.subscribers.remove(subscriber)
+            if stream.writer is subscriber:
+                stream.writer = None
+        subscriber.close()
+
+    def tail(self, name, lines):
+        """Return the last lines of an instance's output, or None if it never ran."""
+        with self.lock:
+            scrollback = self.scrollbacks.get(name)
+            if scrollback is None:
+                return None
+            return scrollback.last_lines(lines)
+
+    def resize_scrollback(self, name, size):
+        """Give an instance's scrollbacks a new size, keeping the most recent output."""
+        with self.lock:
+            for key in (name, name + ".stderr"):
+                old = self.scrollbacks.get(key)
+                if old is None or old.size == size:
+                    continue
+                new = self.scrollbacks[key] = Scrollback(size)
+                new.write(old.snapshot())
+                for stream in self.streams.values():
+                    if stream.scrollback is old:
+                        stream.scrollback = new
+
+    def discard_scrollback(self, name):
+        """Forget the stdout and stderr scrollbacks of an instance that no longer exists."""
+        with self.lock:
+            for suffix in ("", ".stderr"):
+                self.scrollbacks.pop(name + suffix, None)
+
+    def rename(self, old_name, new_name):
+        """Move the output streams and scrollback of an instance to a new name."""
+        with self.lock:
+            for suffix in ("", ".stderr"):
+                # Whatever new_name had before belongs to the instance it replaces.
+                self.scrollbacks.pop(new_name + suffix, None)
+                scrollback = self.scrollbacks.pop(old_name + suffix, None)
+                if scrollback is not None:
+                    self.scrollbacks[new_name + suffix] = scrollback
+                for stream in self.streams.values():
+                    if stream.name == old_name + suffix:
+                        stream.name = new_name + suffix
+
+    def subscriber_count(self, master_fd):
+        with self.lock:
+            stream = self.streams.get(master_fd)
+            return len(stream.subscribers) if stream else 0
+
+    def detach_all(self, master_fd):
+        """Close every subscription of a PTY."""
+        with self.lock:
+            stream = self.streams.get(master_fd)
+            subscribers = list(stream.subscribers) if stream else []
+        for subscriber in subscribers:
+            self.unsubscribe(subscriber)
+
+    def write_input(self, subscriber, data):
+        """Queue keystrokes for the PTY if the subscriber holds the keyboard.
+
+        Never blocks: the hub loop writes the queue whenever the terminal has
+        room. A process that stops reading its input cannot make the queue
+        grow past INPUT_QUEUE_BYTES; input beyond that is dropped.
+        """
+        with self.lock:
+            stream = subscriber.stream
+            if not subscriber.writable or stream.writer is not subscriber:
+                return
+            if self.streams.get(stream.master_fd) is not stream:
+                return  # Released: the fd number may already belong to something else.
+            if stream.input_bytes + len(data) > self.INPUT_QUEUE_BYTES:
+                if not stream.input_dropped:
+                    print(f"Warning: '{stream.name}' is not reading its input, dropping keystrokes")
+                stream.input_dropped += len(data)
+                return
+            if not stream.input:
+                self.selector.modify(stream.master_fd, selectors.EVENT_READ | selectors.EVENT_WRITE, stream)
+            stream.input.append(bytes(data))
+            stream.input_bytes += len(data)
+        self._wakeup()
+
+    def _write_input(self, stream):
+        """Write queued keystrokes until the terminal is full; called with the lock held."""
+        while stream.input:
+            chunk = stream.input[0]
+            try:
+                written = os.write(stream.master_fd, chunk)
+            except BlockingIOError:
+                return
+            except OSError:
+                # The terminal is going away; nobody will read this input.
+                stream.input.clear()
+                stream.input_bytes = 0
+                break
+            stream.input_bytes -= written
+            if written < len(chunk):
+                stream.input[0] = chunk[written:]
+                return
+            stream.input.popleft()
+        if stream.input_dropped:
+            print(f"Warning: dropped {stream.input_dropped} bytes of input to '{stream.name}'")
+            stream.input_dropped = 0
+        self.selector.modify(stream.master_fd, selectors.EVENT_READ, stream)
+
+    def release(self, master_fd):
+        """Stop reading a PTY and close its master fd.
+
+        This is the only place a master fd may be closed, so the reader thread
+        can never read from a descriptor number that was closed and reused,
+        and releasing the same fd twice is harmless.
+        """
+        if not master_fd:
+            return
+        with self.lock:
+            if master_fd not in self.owned_fds:
+                # Already released: closing again could hit an unrelated, reused fd.
+                return
+            self.owned_fds.discard(master_fd)
+            stream = self.streams.get(master_fd)
+            if stream is not None:
+                self._drain(stream)
+                self._forget(stream)
+            try:
+                os.close(master_fd)
+            except OSError:
+                pass
+
+    def _drain(self, stream):
+        # Pick up whatever the process wrote just before it went away.
+        buffer = bytearray(self.READ_SIZE)
+        while True:
+            try:
+                count = os.readv(stream.master_fd, [buffer])
+            except OSError:
+                return
+            if not count:
+                return
+            self._dispatch(stream, bytes(buffer[:count]))
+
+    def _forget(self, stream):
+        """Unregister a stream, flush its log and end its subscriptions."""
+        self.streams.pop(stream.master_fd, None)
+        try:
+            self.selector.unregister(stream.master_fd)
+        except (KeyError, ValueError):
+            pass
+        stream.close_log()
+        for subscriber in list(stream.subscribers):
+            subscriber.close()
+        stream.subscribers = []
+        stream.writer = None
+        stream.input.clear()
+        stream.input_bytes = 0
+        stream.input_dropped = 0
+
+    def _dispatch(self, stream, chunk):
+        stream.scrollback.write(chunk)
+        stream.record(chunk)
+        if len(stream.pending) >= self.FLUSH_BYTES:
+            stream.flush()
+        for subscriber in stream.subscribers:
+            subscriber.push(chunk)
+
+    def _loop(self):
+        buffer = bytearray(self.READ_SIZE)
+        view = memoryview(buffer)
+        last_flush = time.monotonic()
+        while True:
+            for key, mask in self.selector.select(timeout=self.FLUSH_INTERVAL):
+                stream = key.data
+                if stream is None:
+                    # Wakeup pipe: a PTY was registered or input was queued, select again.
+                    try:
+                        os.read(self.wakeup_read, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                with self.lock:
+                    if self.streams.get(stream.master_fd) is not stream:
+                        continue
+                    if mask & selectors.EVENT_WRITE:
+                        self._write_input(stream)
+                    if not mask & selectors.EVENT_READ:
+                        continue
+                    try:
+                        count = os.readv(stream.master_fd, [buffer])
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        count = 0
+                    if not count:
+                        # EIO/EOF: the process is gone, end every subscription.
+                        self._forget(stream)
+                        if stream.close_on_eof:
+                            self.owned_fds.discard(stream.master_fd)
+                            os.close(stream.master_fd)
+                    else:
+                        self._dispatch(stream, bytes(view[:count]))
+
+            # Batched log writes: whatever is pending goes out at least every FLUSH_INTERVAL.
+            if time.monotonic() - last_flush >= self.FLUSH_INTERVAL:
+                with self.lock:
+                    for stream in self.streams.values():
+                        stream.flush()
+                last_flush = time.monotonic()
+
+
+hub = PtyHub()
@@ -0,0 +1,110 @@
+import os
+import signal
+import selectors
+import threading
+import time
+from collections import OrderedDict
+from helper import decode_wait_status
+
+
+class ChildReaper:
+    """Reap children as soon as SIGCHLD arrives and record how they exited."""
+
+    MAX_REMEMBERED_EXITS = 1024
+
+    def __init__(self):
+        self.exit_codes = OrderedDict()
+        self.listeners = []
+        self.condition = threading.Condition()
+        self.selector = selectors.DefaultSelector()
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        os.set_blocking(self.write_fd, False)
+        self.thread = None
+
+    def install(self):
+        """Route SIGCHLD to the self-pipe and start the reaper thread.
+
+        Must be called from the main thread, before any child is spawned.
+        """
+        signal.signal(signal.SIGCHLD, self._on_sigchld)
+        signal.siginterrupt(signal.SIGCHLD, False)
+        signal.set_wakeup_fd(self.write_fd, warn_on_full_buffer=False)
+        self.selector.register(self.read_fd, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._loop, name="reaper", daemon=True)
+        self.thread.start()
+
+    def add_listener(self, callback):
+        """Register callback(pid, exit_code), called from the reaper thread on every exit."""
+        self.listeners.append(callback)
+
+    def _on_sigchld(self, signum, frame):
+        # The wakeup fd already carries the notification to the reaper thread.
+        pass
+
+    def _drain(self):
+        try:
+            while os.read(self.read_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _loop(self):
+        while True:
+            # The timeout is only a safety net; exits are normally seen through the pipe.
+            for _key, _mask in self.selector.select(timeout=1.0):
+                self._drain()
+            self.reap()
+
+    def reap(self):
+        """Collect every exited child without blocking and notify listeners."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            exit_code = decode_wait_status(status)
+            with self.condition:
+                self.exit_codes[pid] = (exit_code, time.monotonic())
+                while len(self.exit_codes) > self.MAX_REMEMBERED_EXITS:
+                    self.exit_codes.popitem(last=False)
+                self.condition.notify_all()
+
+            for listener in list(self.listeners):
+                try:
+                    listener(pid, exit_code)
+                except Exception as e:
+                    print(f"Warning: reaper listener failed for pid {pid}: {e}")
+
+    def _exit_since(self, pid, since):
+        record = self.exit_codes.get(pid)
+        if record is None or record[1] < since:
+            # Nothing recorded, or a stale exit from an earlier owner of this pid.
+            return None
+        return record
+
+    def exit_since(self, pid, since):
+        """Exit code of pid if it was reaped after `since` (time.monotonic()), else None."""
+        with self.condition:
+            record = self._exit_since(pid, since)
+            return record[0] if record else None
+
+    def wait_for_exit(self, pid, timeout, since=0.0):
+        """Wait up to timeout seconds for pid to exit.
+
+        Returns (alive, exit_code) like isalive_process, but wakes up the
+        moment the child dies instead of after the whole timeout. Exits
+        reaped before `since` (a time.monotonic() value taken before the
+        fork) are ignored so a recycled pid is never mistaken for a crash.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self._exit_since(pid, since) is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True, None
+                self.condition.wait(remaining)
+            return False, self.exit_codes[pid][0]
@@ -1,96 +1,178 @@
-import os
-from termcolor import colored
+from pty_hub import hub as pty_hub
+from helper import get_path, log_limits
 from ParseConfige import ConfigParser
+from reply import message
+from start_handler import StartHandler
+from stop_handler import StopHandler
+from rollout import RollingRestart, parse_rollout_args
 
 class ReloadHandler:
+    # Options a running process was spawned with; changing one needs a new process.
+    SPAWN_FIELDS = {'cmd', 'env', 'workingdir', 'umask', 'stdout', 'stderr'}
+    # Options of the daemon-side output handling, applied to the running instances in place.
+    OUTPUT_FIELDS = {
+        'scrollback_bytes',
+        'stdout_logfile_maxbytes', 'stdout_logfile_backups', 'stdout_logfile_maxage',
+        'stderr_logfile_maxbytes', 'stderr_logfile_backups', 'stderr_logfile_maxage',
+    }
+
     def __init__(self, commands_instance):
         self.commands = commands_instance
+        # (max_unavailable, surge) when the reload was asked to roll, else None.
+        self.rollout = None
 
     def delete_process_info_entries(self, program_name):
         """Delete all process_info entries for a given program name."""
-        keys_to_delete = []
-        for key, info in self.commands.process_info.items():
-            if info.get('program_name') == program_name:
-                keys_to_delete.append(key)
-
-        for key in keys_to_delete:
-            master_fd = self.commands.process_info[key].get('master_fd')
-            if master_fd:
-                try:
-                    os.close(master_fd)
-                except:
-                    pass
-            del self.commands.process_info[key]
+        for key in self.commands.process_info.instances(program_name):
+            self.commands.forget_instance(key)
 
         if program_name in self.commands.running_processes:
             del self.commands.running_processes[program_name]
 
+    def changed_fields(self, old_program, new_program):
+        """Names of the options that differ between two configurations of a program."""
+        changed = set()
+        for key in (set(old_program.keys()) | set(new_program.keys())) - {'name'}:
+            old_val = old_program.get(key)
+            new_val = new_program.get(key)
+            if old_val != new_val:
+                changed.add(key)
+        return changed
+
     def program_has_changed(self, old_config, new_config, program_name):
         """Check if the configuration of a program has changed."""
         old_program = old_config.get(program_name, {})
         new_program = new_config.get(program_name, {})
+        return bool(self.changed_fields(old_program, new_program))
+
+    def respawn_program(self, program_name, new_program):
+        """Replace every instance of a program: stop them all, then start the new configuration."""
+        old_program = self.commands.programs[program_name]
+        StopHandler(self.commands).stop_instances(old_program, self.commands.process_info.instances(program_name), True)
+        self.delete_process_info_entries(program_name)
+        self.commands.programs[program_name] = new_program
+        self.commands.generations[program_name] = self.commands.generation_of(program_name) + 1
+        return self.commands.start_command(self.commands.programs, program_name)
+
+    def roll_program(self, program_name, new_program):
+        """Replace a program's instances with the new configuration a batch at a time.
+
+        Instances numprocs removes are stopped first and instances it adds are
+        started last, so only the ones that stay are rolled. If the rollout is
+        rolled back, the removed instances are started again and the program
+        keeps its old configuration.
+        """
+        old_program = self.commands.programs[program_name]
+        old_numprocs = old_program.get('numprocs', 1)
+        new_numprocs = new_program.get('numprocs', 1)
+        max_unavailable, surge = self.rollout
+        out = []
+        if new_numprocs < old_numprocs:
+            out.extend(self.scale_program(program_name, old_numprocs, new_numprocs))
+        rollout = RollingRestart(self.commands, program_name, old_program, new_program,
+                                 max_unavailable, surge, is_reload=True)
+        out.extend(rollout.run())
+        if not rollout.completed:
+            if new_numprocs < old_numprocs:
+                out.extend(self.scale_program(program_name, new_numprocs, old_numprocs))
+        elif new_numprocs > old_numprocs:
+            out.extend(self.scale_program(program_name, old_numprocs, new_numprocs))
+        return out
 
-        if bool(old_program) != bool(new_program):
-            return True
-
-        if not old_program and not new_program:
-            return False
-
-        ignore_keys = {'name'}
-
-        all_keys = (set(old_program.keys()) | set(
-            new_program.keys())) - ignore_keys
-
-        for key in all_keys:
-            old_val = old_program.get(key)
-            new_val = new_program.get(key)
-
-            if old_val is None and new_val is None:
-                continue
-            if old_val is None or new_val is None:
-                print(
-                    f"DEBUG: '{program_name}' - key '{key}' changed: {old_val} -> {new_val}")
-                return True
+    def apply_output_settings(self, program_name, program):
+        """Resize the scrollbacks and update the log rotation limits of a program's running instances."""
+        size = program.get('scrollback_bytes', pty_hub.DEFAULT_SCROLLBACK_BYTES)
+        for key in self.commands.process_info.instances(program_name):
+            pty_hub.resize_scrollback(key, size)
+        for stream in ('stdout', 'stderr'):
+            path = get_path(program.get(stream))
+            if path:
+                pty_hub.set_log_limits(path, *log_limits(program, stream))
+
+    def scale_program(self, program_name, old_numprocs, new_numprocs):
+        """Start or stop only the instances numprocs added or removed."""
+        program = self.commands.programs[program_name]
+        start_handler = StartHandler(self.commands)
+        out = []
+        if new_numprocs > old_numprocs:
+            jobs = start_handler.instance_jobs(program, program_name)[old_numprocs:]
+            results = start_handler.start_instances(jobs, False)
+            start_handler.summarize_program(program_name, len(jobs), results.values(), out)
+            out.append(message(f"Started {len(jobs)} new instance(s) of '{program_name}'.", "success"))
+        else:
+            old_jobs = start_handler.instance_jobs(program.replace(numprocs=old_numprocs), program_name)
+            removed = [indexed_name for _, indexed_name in old_jobs[new_numprocs:]
+                       if indexed_name in self.commands.process_info]
+            StopHandler(self.commands).stop_instances(program, removed)
+            for indexed_name in removed:
+                self.commands.forget_instance(indexed_name)
+            out.append(message(f"Stopped {len(removed)} instance(s) of '{program_name}'.", "success"))
+        return out
 
-            if old_val != new_val:
-                print(
-                    f"DEBUG: '{program_name}' - key '{key}' changed: {old_val} -> {new_val}")
-                return True
+    def reload_program(self, program_name, new_program):
+        """Apply a program's new configuration, disturbing as few instances as possible.
+
+        Options in SPAWN_FIELDS are baked into the running processes, so a
+        change there respawns every instance. A numprocs change starts or
+        stops only the difference (unless it switches between one unnumbered
+        instance and numbered ones). Anything else is policy read when it is
+        needed, or (OUTPUT_FIELDS) applied to the hub's scrollbacks and log
+        writers, and takes effect without touching a process. A rolling reload
+        replaces the respawned instances a batch at a time instead.
+        """
+        old_program = self.commands.programs[program_name]
+        changed = self.changed_fields(old_program, new_program)
+        if not changed:
+            return [message(f"No changes detected for program '{program_name}'.", "warning")]
+
+        out = [message(f"Detected changes in '{program_name}' configuration: {', '.join(sorted(changed))}")]
+        old_numprocs = old_program.get('numprocs', 1)
+        new_numprocs = new_program.get('numprocs', 1)
+        renamed = 'numprocs' in changed and 1 in (old_numprocs, new_numprocs)
+        if changed & self.SPAWN_FIELDS and self.rollout and not renamed:
+            out.extend(self.roll_program(program_name, new_program))
+            return out
+        if changed & self.SPAWN_FIELDS or renamed:
+            if self.rollout:
+                out.append(message(f"'{program_name}' switches between one and several instances, "
+                                   "which renames them: restarting it at once.", "warning"))
+            out.extend(self.respawn_program(program_name, new_program))
+            out.append(message(f"Program '{program_name}' reloaded successfully.", "success"))
+            return out
 
-        return False
+        self.commands.programs[program_name] = new_program
+        if changed & self.OUTPUT_FIELDS:
+            self.apply_output_settings(program_name, new_program)
+        if any(field.startswith('backoff_') for field in changed):
+            for key in self.commands.process_info.instances(program_name):
+                self.commands.backoffs.pop(key, None)
+        if 'numprocs' in changed:
+            out.extend(self.scale_program(program_name, old_numprocs, new_numprocs))
+        policy = sorted(changed - {'numprocs'})
+        if policy:
+            out.append(message(f"Applied {', '.join(policy)} to '{program_name}' without restarting it.", "success"))
+        return out
 
     def reload_single_program(self, program_name, new_programs):
         """Reload a single program if its configuration has changed."""
-        out = []
-        
         if program_name not in new_programs:
-            out.append(colored(f"ERROR: Program '{program_name}' not found in new configuration.", "red"))
-            return out
-
-        if self.program_has_changed(self.commands.programs, new_programs, program_name):
-            out.append(f"Detected changes in '{program_name}' configuration")
-            self.commands.stop_command(self.commands.programs, program_name, True)
-            self.delete_process_info_entries(program_name)
+            return [message(f"ERROR: Program '{program_name}' not found in new configuration.", "error")]
+        if program_name not in self.commands.programs:
             self.commands.programs[program_name] = new_programs[program_name]
-
-            result = self.commands.start_command(self.commands.programs, program_name)
-            out.append(result)
-            out.append(colored(f"Program '{program_name}' reloaded successfully.", "green"))
-        else:
-            out.append(colored(f"No changes detected for program '{program_name}'.", "yellow"))
-        
-        return out
+            return self.commands.start_command(self.commands.programs, program_name)
+        return self.reload_program(program_name, new_programs[program_name])
 
     def remove_deleted_programs(self, new_programs):
         """Remove programs that no longer exist in the new configuration."""
         out = []
         for pname in list(self.commands.programs.keys()):
             if pname not in new_programs:
-                out.append(f"Removing program '{pname}'...")
-                self.commands.stop_command(self.commands.programs, pname, True)
+                out.append(message(f"Removing program '{pname}'..."))
+                StopHandler(self.commands).stop_instances(self.commands.programs[pname], self.commands.process_info.instances(pname), True)
                 self.delete_process_info_entries(pname)
                 del self.commands.programs[pname]
-                out.append(colored(f"Program '{pname}' removed.", "yellow"))
+                self.commands.generations.pop(pname, None)
+                out.append(message(f"Program '{pname}' removed.", "warning"))
         return out
 
     def update_or_add_programs(self, new_programs):
@@ -98,27 +180,24 @@ class ReloadHandler:
         out = []
         for pname, pdata in new_programs.items():
             if pname not in self.commands.programs:
-                out.append(f"Adding new program '{pname}'...")
+                out.append(message(f"Adding new program '{pname}'..."))
                 self.commands.programs[pname] = pdata
                 result = self.commands.start_command(self.commands.programs, pname)
-                out.append(result)
-                out.append(colored(f"Program '{pname}' added and started.", "green"))
-            elif self.program_has_changed(self.commands.programs, new_programs, pname):
-                out.append(f"Detected changes in '{pname}' configuration")
-                self.commands.stop_command(self.commands.programs, pname, True)
-                self.delete_process_info_entries(pname)
-                self.commands.programs[pname] = pdata
-                result = self.commands.start_command(self.commands.programs, pname)
-                out.append(result)
-                out.append(colored(f"Program '{pname}' reloaded successfully.", "green"))
+                out.extend(result)
+                out.append(message(f"Program '{pname}' added and started.", "success"))
             else:
-                out.append(colored(f"No changes detected for program '{pname}'.", "yellow"))
+                out.extend(self.reload_program(pname, pdata))
         return out
 
     def reload_command(self, program_name=None, config_path='../../configs/config.yml'):
         """Reload the configuration and restart affected programs."""
         out = []
-        out.append(colored("Reloading configuration...", "cyan"))
+        try:
+            program_name, rolling, max_unavailable, surge = parse_rollout_args(program_name)
+        except ValueError as e:
+            return [message(f"Error: {e}", "error")]
+        self.rollout = (max_unavailable, surge) if rolling else None
+        out.append(message("Reloading configuration...", "info"))
 
         try:
             new_programs = ConfigParser.parse_config_file(config_path)
@@ -132,11 +211,11 @@ class ReloadHandler:
                 out.extend(remove_output)
                 out.extend(update_output)
 
-            out.append(colored("\nReload completed.", "green"))
+            out.append(message("Reload completed.", "success"))
 
         except Exception as e:
             err = f"ERROR: Failed to reload configuration: {e}"
-            out.append(colored(err, "red"))
+            out.append(message(err, "error"))
             print(err)
 
-        return "\n".join(out)
\ No newline at end of file
+        return out
\ No newline at end of file
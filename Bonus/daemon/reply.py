@@ -0,0 +1,33 @@
+import json
+
+# Severity of a message; taskmasterctl picks the colors.
+LEVELS = ("info", "success", "warning", "error")
+
+
+def message(text, level="info"):
+    """One human-readable line of a command reply."""
+    return {"level": level, "text": text}
+
+
+def encode(command, result=None):
+    """Serialize a command result as the JSON reply sent to taskmasterctl.
+
+    result is a list of messages, or a dict of data fields that may carry
+    its own "messages". The reply is
+    {"command": ..., "ok": ..., "messages": [...], <data fields>}, where ok
+    is False as soon as one message is an error.
+    """
+    if isinstance(result, dict):
+        data = dict(result)
+        messages = data.pop("messages", [])
+    else:
+        data = {}
+        messages = result or []
+    messages = [item if isinstance(item, dict) else message(str(item)) for item in messages]
+    reply = {
+        "command": command,
+        "ok": not any(item["level"] == "error" for item in messages),
+        "messages": messages,
+    }
+    reply.update(data)
+    return json.dumps(reply)
@@ -0,0 +1,174 @@
+from reply import message
+from start_handler import StartHandler
+from stop_handler import StopHandler
+
+
+def parse_rollout_args(args):
+    """Split '[program] [--rolling] [--max-unavailable N] [--surge [M]]' into (name, rolling, max_unavailable, surge).
+
+    A bare --surge starts the whole new generation next to the old one
+    (surge None, max_unavailable 0 unless given). Raises ValueError on a
+    malformed option.
+    """
+    parts = (args or "").split()
+    name, rolling, max_unavailable, surge = None, False, None, 0
+    i = 0
+    while i < len(parts):
+        part = parts[i]
+        has_count = i + 1 < len(parts) and parts[i + 1].isdigit()
+        if part == "--surge" and not has_count:
+            surge = None
+        elif part in ("--max-unavailable", "--surge"):
+            if not has_count:
+                raise ValueError(f"{part} expects a number of instances")
+            if part == "--surge":
+                surge = int(parts[i + 1])
+            else:
+                max_unavailable = int(parts[i + 1])
+            i += 1
+        elif part == "--rolling":
+            pass
+        elif part.startswith("-"):
+            raise ValueError(f"unknown option '{part}'")
+        elif name is None:
+            name = part
+        if part.startswith("-"):
+            rolling = True
+        i += 1
+    if max_unavailable is None:
+        max_unavailable = 0 if surge is None else 1
+    if max_unavailable == 0 and surge == 0:
+        raise ValueError("--max-unavailable and --surge cannot both be 0")
+    if name is not None and name.lower() == "all":
+        name = None
+    return name, rolling, max_unavailable, surge
+
+
+class RollingRestart:
+    """Move the instances of a program to a new configuration generation a batch at a time.
+
+    A batch takes up to max_unavailable + surge instances. Up to `surge` of
+    the running ones get a replacement started next to them, named
+    '<instance>@<generation>', and are stopped only once every new instance
+    of the batch is RUNNING; each replacement then takes the name of the
+    instance it replaced. The others (at most max_unavailable) are stopped
+    and started again in place. With surge None the whole new generation is
+    started next to the old one in a single batch.
+
+    The program's configuration and generation switch over only when every
+    instance made it. If a new instance goes FATAL instead, the rollout is
+    rolled back: replacements of the failed batch are dropped, so the old
+    instances they stood next to never stopped, and instances already moved
+    to the new generation are rolled back to the old one the same way.
+    """
+
+    def __init__(self, commands, program_name, old_program, new_program, max_unavailable=1, surge=0,
+                 is_reload=False, generation=None, can_roll_back=True):
+        self.commands = commands
+        self.program_name = program_name
+        self.old_program = old_program
+        self.new_program = new_program
+        self.max_unavailable = max_unavailable
+        self.surge = surge
+        self.is_reload = is_reload
+        self.old_generation = commands.generation_of(program_name)
+        self.generation = self.old_generation + 1 if generation is None else generation
+        self.can_roll_back = can_roll_back
+        self.completed = False
+        self.start_handler = StartHandler(commands)
+        self.stop_handler = StopHandler(commands)
+
+    def replacement_name(self, indexed_name):
+        """Name a surge replacement runs under until the instance it replaces is stopped."""
+        return f"{indexed_name}@{self.generation}"
+
+    def is_running(self, indexed_name):
+        info = self.commands.process_info.get(indexed_name)
+        return info is not None and info.state == 'RUNNING'
+
+    def run(self, names=None):
+        """Roll the given instances (by default all of the program's); returns the messages."""
+        if names is None:
+            names = self.commands.process_info.instances(self.program_name)
+        surge = len(names) if self.surge is None else self.surge
+        max_unavailable = 0 if self.surge is None else self.max_unavailable
+        out = [message(f"Rolling '{self.program_name}' to generation {self.generation}: {len(names)} instance(s), "
+                       f"max unavailable {max_unavailable}, surge {surge}")]
+        step = max(1, max_unavailable + surge)
+        moved = []
+        for first in range(0, len(names), step):
+            batch = names[first:first + step]
+            print(f"INFO rolling: '{self.program_name}' replacing {', '.join(batch)} "
+                  f"with generation {self.generation}")
+            touched, replaced = self.replace_batch(batch, surge, out)
+            moved.extend(touched)
+            if not replaced:
+                out.append(message(f"Generation {self.generation} of '{self.program_name}' "
+                                   f"did not reach RUNNING.", "error"))
+                if self.can_roll_back:
+                    self.roll_back(moved, out)
+                return out
+
+        self.commands.programs[self.program_name] = self.new_program
+        self.commands.generations[self.program_name] = self.generation
+        self.completed = True
+        out.append(message(f"'{self.program_name}' is running generation {self.generation}.", "success"))
+        return out
+
+    def replace_batch(self, names, surge, out):
+        """Replace one batch.
+
+        Returns (touched, replaced): the instances that no longer run the old
+        generation, and whether every new instance reached RUNNING.
+        """
+        surged = [name for name in names if self.is_running(name)][:surge]
+        in_place = [name for name in names if name not in surged]
+
+        self.stop_handler.stop_instances(self.old_program, in_place, self.is_reload)
+        for name in in_place:
+            # A new process starts over from backoff_base, with the new configuration's values.
+            self.commands.backoffs.pop(name, None)
+        jobs = [(self.new_program, self.replacement_name(name)) for name in surged]
+        jobs += [(self.new_program, name) for name in in_place]
+        results = self.start_handler.start_instances(jobs, False, self.generation)
+        for _, indexed_name in jobs:
+            out.extend(results[indexed_name][1])
+
+        replaced = True
+        for name in surged:
+            if not self.is_running(self.replacement_name(name)):
+                out.append(message(f"The replacement of '{name}' did not reach RUNNING.", "error"))
+                replaced = False
+        for name in in_place:
+            if not self.is_running(name):
+                out.append(message(f"'{name}' did not reach RUNNING after its restart.", "error"))
+                replaced = False
+
+        if not replaced:
+            # Drop every replacement of the batch; the instances they stood next to keep running.
+            replacements = [self.replacement_name(name) for name in surged]
+            self.stop_handler.stop_instances(self.new_program, replacements)
+            for replacement in replacements:
+                self.commands.forget_instance(replacement)
+            return in_place, False
+
+        self.stop_handler.stop_instances(self.old_program, surged, self.is_reload)
+        for name in surged:
+            self.commands.replace_instance(name, self.replacement_name(name))
+            out.append(message(f"Replaced '{name}'.", "success"))
+        for name in in_place:
+            out.append(message(f"Restarted '{name}'.", "success"))
+        return names, True
+
+    def roll_back(self, names, out):
+        """Move instances that already left the old generation back to it."""
+        if not names:
+            out.append(message(f"Rolled back: '{self.program_name}' still runs generation "
+                               f"{self.old_generation} everywhere.", "warning"))
+            return
+        out.append(message(f"Rolling {len(names)} instance(s) of '{self.program_name}' back to generation "
+                           f"{self.old_generation}...", "warning"))
+        rollback = RollingRestart(self.commands, self.program_name, self.new_program, self.old_program,
+                                  self.max_unavailable, self.surge, self.is_reload,
+                                  generation=self.old_generation, can_roll_back=False)
+        out.extend(rollback.run(names))
@@ -0,0 +1,54 @@
+class Scrollback:
+    """Fixed-size ring buffer holding the most recent output of one instance.
+
+    Memory use is exactly `size` bytes no matter how much the process writes;
+    older output is overwritten in place.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.buffer = bytearray(size)
+        self.end = 0
+        self.filled = False
+
+    def write(self, data):
+        """Append data, overwriting the oldest bytes once the buffer is full."""
+        if not self.size or not data:
+            return
+        view = memoryview(data)
+        if len(view) >= self.size:
+            self.buffer[:] = view[len(view) - self.size:]
+            self.end = 0
+            self.filled = True
+            return
+
+        first = min(len(view), self.size - self.end)
+        self.buffer[self.end:self.end + first] = view[:first]
+        rest = len(view) - first
+        if rest:
+            self.buffer[:rest] = view[first:]
+            self.end = rest
+            self.filled = True
+        else:
+            self.end += first
+            if self.end == self.size:
+                self.end = 0
+                self.filled = True
+
+    def snapshot(self):
+        """Return the buffered output, oldest byte first."""
+        if not self.filled:
+            return bytes(self.buffer[:self.end])
+        return bytes(self.buffer[self.end:]) + bytes(self.buffer[:self.end])
+
+    def last_lines(self, count):
+        """Return at most the last `count` lines of buffered output."""
+        data = self.snapshot()
+        if count <= 0:
+            return b""
+        pos = len(data) - 1 if data.endswith(b"\n") else len(data)
+        for _ in range(count):
+            pos = data.rfind(b"\n", 0, pos)
+            if pos < 0:
+                return data
+        return data[pos + 1:]
@@ -1,27 +1,152 @@
+import queue
 import smtplib
+import threading
+import time
 from email.message import EmailMessage
 from email_config import get_email_config
 
+
 class EmailAlerter:
-    def __init__(self):
-        config = get_email_config()
+    """Send alerts by email from a background worker.
+
+    send_alert() only puts the alert on a bounded queue, so starting or
+    stopping programs never waits on the mail server. The worker merges every
+    alert raised within digest_window seconds into one message and reuses a
+    single SMTP session, closing it after SESSION_IDLE_TIMEOUT seconds idle.
+    """
+
+    MAX_QUEUED_ALERTS = 256
+    DEFAULT_DIGEST_WINDOW = 10
+    SESSION_IDLE_TIMEOUT = 60
+    SMTP_TIMEOUT = 30
+    SEVERITIES = ["INFO", "WARNING", "ERROR", "CRITICAL"]
+
+    def __init__(self, digest_window=None, max_queued_alerts=MAX_QUEUED_ALERTS, config=None):
+        if config is None:
+            config = get_email_config()
         self.smtp_server = config['smtp_server']
         self.smtp_port = config['smtp_port']
+        # Plain SMTP is for a local relay; anything else goes over SMTPS.
+        self.smtp_class = smtplib.SMTP_SSL if config.get('smtp_ssl', True) else smtplib.SMTP
         self.username = config['username']
         self.password = config['password']
         self.recipients = config['recipients']
-    
+        if digest_window is None:
+            digest_window = config.get('digest_window', self.DEFAULT_DIGEST_WINDOW)
+        self.digest_window = digest_window
+        self.queue = queue.Queue(max_queued_alerts)
+        self.dropped = 0
+        self.smtp = None
+        # Guards starting the worker and the dropped count, which callers bump and the worker resets.
+        self.lock = threading.Lock()
+        self.thread = None
+
     def send_alert(self, subject, message, severity="INFO"):
+        """Queue an alert for delivery; never blocks."""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._worker, name="email-alerter", daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait((time.strftime("%Y-%m-%d %H:%M:%S"), subject, message, severity))
+        except queue.Full:
+            # The mail server cannot keep up; the next digest reports how many were lost.
+            with self.lock:
+                self.dropped += 1
+
+    def close(self, timeout=5.0):
+        """Deliver what is queued right away and stop the worker."""
+        if self.thread is None:
+            return
         try:
-            msg = EmailMessage()
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+    def _worker(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.SESSION_IDLE_TIMEOUT)
+            except queue.Empty:
+                self._close_session()
+                continue
+            if first is None:
+                self._close_session()
+                return
+
+            batch = [first]
+            closing = False
+            deadline = time.monotonic() + self.digest_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    alert = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if alert is None:
+                    closing = True
+                    break
+                batch.append(alert)
+
+            try:
+                self._deliver(self._compose(batch))
+            except Exception as e:
+                # One bad batch must not end the worker, or no alert would ever go out again.
+                self._close_session()
+                print(f"Failed to send {len(batch)} email alert(s): {e}")
+            if closing:
+                self._close_session()
+                return
+
+    def _compose(self, batch):
+        with self.lock:
+            dropped, self.dropped = self.dropped, 0
+        msg = EmailMessage()
+        if len(batch) == 1 and not dropped:
+            _, subject, message, severity = batch[0]
             msg.set_content(f"[{severity}] {message}")
             msg["Subject"] = f"TASKMASTER ALERT: {subject}"
-            msg["From"] = self.username
-            msg["To"] = ", ".join(self.recipients)
-            
-            with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as smtp:
-                smtp.login(self.username, self.password)
-                smtp.send_message(msg)
-                
-        except Exception as e:
-            print(f"Failed to send email alert: {e}")
\ No newline at end of file
+        else:
+            worst = max((alert[3] for alert in batch), key=self._severity_rank)
+            lines = [f"{sent_at} [{severity}] {subject}: {message}"
+                     for sent_at, subject, message, severity in batch]
+            if dropped:
+                lines.append(f"{dropped} more alert(s) were dropped because the queue was full")
+            msg.set_content("\n".join(lines))
+            msg["Subject"] = f"TASKMASTER ALERT: {len(batch)} alerts ({worst})"
+        msg["From"] = self.username
+        msg["To"] = ", ".join(self.recipients)
+        return msg
+
+    def _severity_rank(self, severity):
+        return self.SEVERITIES.index(severity) if severity in self.SEVERITIES else 0
+
+    def _deliver(self, msg):
+        # A reused session may have been dropped by the server; reconnect once.
+        for attempt in range(2):
+            try:
+                if self.smtp is None:
+                    self.smtp = self.smtp_class(self.smtp_server, self.smtp_port, timeout=self.SMTP_TIMEOUT)
+                    self.smtp.login(self.username, self.password)
+                self.smtp.send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                self._close_session()
+                if attempt:
+                    print(f"Failed to send email alert: {e}")
+            except Exception as e:
+                self._close_session()
+                print(f"Failed to send email alert: {e}")
+                return
+
+    def _close_session(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except Exception:
+            pass
+        self.smtp = None
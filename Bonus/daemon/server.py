@@ -1,9 +1,98 @@
 import socket
 import threading
-import time
-import select
-import os
-from termcolor import colored
+import selectors
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from reply import encode, message
+from protocol import (
+    FrameDecoder, ProtocolError, encode_frame, encode_header, encode_reply,
+    CONTROL_CHANNEL, REQUEST, DATA, CLOSE
+)
+
+
+class ClientConnection:
+    """One taskmasterctl connection: frame decoding, serialized writes and attach channels."""
+
+    MAX_CHANNEL = 0xFFFF
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = FrameDecoder()
+        self.write_lock = threading.Lock()
+        self.channel_lock = threading.Lock()
+        self.channels = {}
+        self.next_channel = CONTROL_CHANNEL + 1
+        self.closed = False
+
+    def send_bytes(self, data):
+        """Write already encoded frames; concurrent replies never interleave."""
+        with self.write_lock:
+            self.sock.sendall(data)
+
+    def send_frame(self, frame_type, request_id=0, channel=CONTROL_CHANNEL, payload=b""):
+        self.send_bytes(encode_frame(frame_type, request_id, channel, payload))
+
+    def send_data(self, channel, payload):
+        """Send raw bytes on an attach channel without copying them into a frame.
+
+        payload may be a memoryview over a reused read buffer; the header and
+        the payload go out together through one sendmsg().
+        """
+        header = encode_header(DATA, 0, channel, len(payload))
+        with self.write_lock:
+            sent = self.sock.sendmsg([header, payload])
+            total = len(header) + len(payload)
+            if sent < total:
+                # Rare short write on a full socket buffer: finish the frame the slow way.
+                if sent < len(header):
+                    self.sock.sendall(header[sent:])
+                    sent = len(header)
+                self.sock.sendall(payload[sent - len(header):])
+
+    def send_reply(self, request_id, text):
+        """Send a complete reply (REPLY chunks then END) for a request."""
+        self.send_bytes(encode_reply(request_id, text))
+
+    def open_channel(self, on_data, on_close):
+        """Allocate an attach channel.
+
+        on_data(payload) is called for every DATA frame the client sends on it,
+        on_close() once when either side closes it.
+        """
+        with self.channel_lock:
+            channel = self.next_channel
+            while channel in self.channels or channel == CONTROL_CHANNEL:
+                channel = channel % self.MAX_CHANNEL + 1
+            self.next_channel = channel % self.MAX_CHANNEL + 1
+            self.channels[channel] = (on_data, on_close)
+        return channel
+
+    def deliver(self, channel, payload):
+        handlers = self.channels.get(channel)
+        if handlers is not None:
+            handlers[0](payload)
+
+    def close_channel(self, channel, notify_peer=True):
+        """Close an attach channel, telling the client unless it asked for it."""
+        with self.channel_lock:
+            handlers = self.channels.pop(channel, None)
+        if handlers is None:
+            return
+        if notify_peer and not self.closed:
+            try:
+                self.send_frame(CLOSE, 0, channel)
+            except OSError:
+                pass
+        handlers[1]()
+
+    def close(self):
+        self.closed = True
+        for channel in list(self.channels):
+            self.close_channel(channel, notify_peer=False)
+        try:
+            self.sock.close()
+        except OSError:
+            pass
 
 
 class TaskmasterCtlServer:
@@ -17,68 +106,135 @@ class TaskmasterCtlServer:
         "help": "Show available commands"
     }
 
-    def __init__(self, host='localhost', port=12345):
+    def __init__(self, host='localhost', port=12345, max_workers=16):
         self.host = host
         self.port = port
+        self.max_workers = max_workers
         self.server_socket = None
+        self.selector = None
+        self.pool = None
+        self.running = False
+        self.on_request = None
+        self.pending_calls = deque()
+        self.wakeup_reader = None
+        self.wakeup_writer = None
 
     def start(self):
         """Start the Taskmaster server to listen for incoming connections."""
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.settimeout(1.0)
+        self.server_socket.setblocking(False)
         self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
+        self.server_socket.listen(128)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server_socket, selectors.EVENT_READ, self._accept)
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, self._run_pending_calls)
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ctl")
+
+    # ---------------------------------------------------------------------- #
+    #                               EVENT LOOP                               #
+    # ---------------------------------------------------------------------- #
 
-    def accept_connection(self):
-        """Accept a new connection from a client with timeout handling."""
+    def serve_forever(self, on_request):
+        """Multiplex every client connection until shutdown() is called.
+
+        on_request(connection, request_id, command, program_name) runs on a
+        worker thread, sends its reply through the connection and returns True
+        to keep the connection open. Requests from one connection are served
+        concurrently, so pipelined commands do not wait for each other.
+        """
+        self.on_request = on_request
+        self.running = True
+        while self.running:
+            for key, _mask in self.selector.select(timeout=1.0):
+                key.data()
+
+    def call_soon(self, callback, *args):
+        """Run callback(*args) on the event loop thread. Safe to call from any thread."""
+        self.pending_calls.append((callback, args))
+        try:
+            self.wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def shutdown(self):
+        """Ask the event loop to stop after the current iteration."""
+        self.call_soon(setattr, self, "running", False)
+
+    def _run_pending_calls(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.pending_calls:
+            callback, args = self.pending_calls.popleft()
+            callback(*args)
+
+    def _accept(self):
         try:
             client_socket, addr = self.server_socket.accept()
-            return client_socket
-        except socket.timeout:
-            return None
+        except (BlockingIOError, InterruptedError):
+            return
+        client_socket.setblocking(True)
+        connection = ClientConnection(client_socket)
+        self.selector.register(client_socket, selectors.EVENT_READ,
+                               lambda: self._read(connection))
 
-    def handle_client(self, client_socket):
-        """Read a single request from a connected client and return the parsed
-        command name and optional program name.
-        """
+    def _read(self, connection):
         try:
-            data = client_socket.recv(4096)
-            if not data:
-                return None, None, None
-
-            command = data.decode('utf-8').strip()
-            
-            # Handle attach command
-            if command.startswith("attach "):
-                parts = command.split(maxsplit=1)
-                if len(parts) > 1:
-                    program_name = parts[1]
-                    return "attach", program_name, None
-                return "attach", None, None
-            
-            # Handle detach command
-            elif command.startswith("detach "):
-                parts = command.split(maxsplit=1)
-                if len(parts) > 1:
-                    program_name = parts[1]
-                    return "detach", program_name, None
-                return "detach", None, None
-            
-            # Handle process_input command
-            elif command.startswith("process_input "):
-                return "process_input", command, None
-
-            # Parse normal commands
-            parts = command.strip().split(maxsplit=1)
-            cmd_name = parts[0].lower()
-            program_name = parts[1] if len(parts) > 1 else None
-            
-            return cmd_name, program_name, None
-            
+            data = connection.sock.recv(65536)
+        except OSError:
+            data = b""
+        if not data:
+            self.close_client(connection)
+            return
+
+        try:
+            frames = connection.decoder.feed(data)
+        except ProtocolError as e:
+            print(f"Error handling client request: {e}")
+            self.close_client(connection)
+            return
+
+        for frame in frames:
+            if frame.type == REQUEST:
+                command = frame.payload.decode('utf-8', 'replace')
+                self.pool.submit(self._run_request, connection, frame.request_id, command)
+            elif frame.type == DATA:
+                connection.deliver(frame.channel, frame.payload)
+            elif frame.type == CLOSE:
+                connection.close_channel(frame.channel, notify_peer=False)
+
+    def _run_request(self, connection, request_id, command):
+        keep_open = False
+        try:
+            command, program_name = self.parse_request(command)
+            if command is None:
+                connection.send_reply(request_id, encode(None, [message("Error: empty command", "error")]))
+                keep_open = True
+            else:
+                keep_open = self.on_request(connection, request_id, command, program_name)
         except Exception as e:
             print(f"Error handling client request: {e}")
-            return None, None, None
+        if not keep_open:
+            self.call_soon(self.close_client, connection)
+
+    def close_client(self, connection):
+        """Forget a client connection and close it."""
+        try:
+            self.selector.unregister(connection.sock)
+        except (KeyError, ValueError):
+            pass
+        connection.close()
+
+    def parse_request(self, command):
+        """Parse one request line and return the command name and optional program name."""
+        return self.process_command(command.strip())
 
     def process_command(self, cmd):
         """
@@ -98,6 +254,20 @@ class TaskmasterCtlServer:
 
     def stop(self):
         """Stop the Taskmaster server."""
+        self.running = False
+        if self.selector:
+            for key in list(self.selector.get_map().values()):
+                if key.fileobj not in (self.server_socket, self.wakeup_reader):
+                    key.fileobj.close()
+            self.selector.close()
+            self.selector = None
+        if self.pool:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+        for sock in (self.wakeup_reader, self.wakeup_writer):
+            if sock:
+                sock.close()
+        self.wakeup_reader = self.wakeup_writer = None
         if self.server_socket:
             self.server_socket.close()
             self.server_socket = None
\ No newline at end of file
@@ -1,9 +1,12 @@
-import os
+import threading
 import time
-from termcolor import colored
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from pty_hub import hub as pty_hub
+from reply import message
 from helper import (
     cleanup_failed_process, should_autorestart,
-    isalive_process, register_process, log_event
+    register_process, stop_process
 )
 
 class StartHandler:
@@ -16,138 +19,140 @@ class StartHandler:
         print(f"INFO Created: '{indexed_name}' with pid {pid}")
         return pid, master_fd
 
-    def verify_process_startup(self, indexed_name, pid, starttime):
-        """Verify if the process starts successfully within the given time."""
-        print(f"INFO Waiting {starttime}s to verify '{indexed_name}' is running...")
-        time.sleep(starttime)
-        return isalive_process(pid)
-
     def handle_process_failure(self, indexed_name, pid, master_fd, exit_code, starttime, exitcodes, retry_count, out):
         """Handle process failure, including cleanup and notifications."""
         if master_fd:
-            try:
-                os.close(master_fd)
-            except:
-                pass
+            pty_hub.release(master_fd)
 
         expected = exit_code in exitcodes if exit_code is not None else False
         msg = (
             f"WARN exited: '{indexed_name}' (exit status {exit_code}; "
             f"{'expected' if expected else 'not expected'}) after {starttime:.1f}s"
         )
-        out.append(colored(msg, "yellow"))
+        out.append(message(msg, "warning"))
         print(msg)
 
         if not expected:
-            self.commands.email_alerter.send_alert(
+            self.commands.alerts.notify(
+                indexed_name, "PROCESS_DIED",
+                f"Process '{indexed_name}' died unexpectedly with exit code {exit_code} after {starttime:.1f}s",
                 subject=f"Process {indexed_name} Failed",
-                message=f"Process '{indexed_name}' died unexpectedly with exit code {exit_code} after {starttime:.1f}s",
                 severity="ERROR"
             )
-            log_event("PROCESS_DIED", f"'{indexed_name}' died unexpectedly with exit code {exit_code}")
         else:
-            log_event("PROCESS_EXITED", f"'{indexed_name}' exited with expected code {exit_code}")
+            self.commands.alerts.notify(indexed_name, "PROCESS_EXITED",
+                                        f"'{indexed_name}' exited with expected code {exit_code}")
+            cleanup_failed_process(indexed_name, pid, self.commands.running_processes,
+                                   self.commands.process_info, "EXITED")
+            self.commands.process_info.update(indexed_name, message=f"exited with expected code {exit_code}")
             return True
 
-        cleanup_failed_process(indexed_name, pid, self.commands.running_processes, self.commands.process_info)
+        cleanup_failed_process(indexed_name, pid, self.commands.running_processes,
+                               self.commands.process_info, "BACKOFF")
+        self.commands.process_info.update(indexed_name, message=f"exited too quickly (exit status {exit_code})")
         return False
 
-    def handle_process_success(self, program, indexed_name, pid, master_fd, retry_count, starttime, out):
+    def handle_process_success(self, program, indexed_name, pid, master_fd, retry_count, starttime, out,
+                               generation=0):
         """Handle successful process start, including registration and logging."""
         register_process(self.commands.running_processes, self.commands.process_info,
-                        program["name"], indexed_name, pid, retry_count, "RUNNING", master_fd)
+                        program["name"], indexed_name, pid, retry_count, "RUNNING", master_fd, generation)
 
         msg = (
             f"INFO success: '{indexed_name}' with pid {pid} entered RUNNING state, "
             f"process has stayed up for > {starttime} seconds\n"
         )
-        out.append(colored(msg, "green"))
+        out.append(message(msg.strip(), "success"))
         print(msg)
-        log_event("PROCESS_RUNNING", f"'{indexed_name}' with pid {pid} entered RUNNING state")
+        self.commands.alerts.notify(indexed_name, "PROCESS_RUNNING",
+                                    f"'{indexed_name}' with pid {pid} entered RUNNING state")
         return True
 
-    def handle_fatal_state(self, program, indexed_name, retry_count, out):
+    def handle_fatal_state(self, program, indexed_name, retry_count, out, generation=0):
         """Handle process entering FATAL state after too many retries."""
         msg = f"\nINFO gave up: '{indexed_name}' entered FATAL state, too many retries\n"
-        self.commands.email_alerter.send_alert(
+        self.commands.alerts.notify(
+            indexed_name, "PROCESS_FATAL",
+            f"Process '{indexed_name}' entered FATAL state after too many failed restart attempts",
             subject=f"CRITICAL: Process {indexed_name} FATAL",
-            message=f"Process '{indexed_name}' entered FATAL state after too many failed restart attempts",
             severity="CRITICAL"
         )
         register_process(self.commands.running_processes, self.commands.process_info,
-                        program["name"], indexed_name, 0, retry_count, "FATAL", None)
-        out.append(colored(msg, "red"))
+                        program["name"], indexed_name, 0, retry_count, "FATAL", None, generation)
+        self.commands.process_info.update(indexed_name, message="too many start retries")
+        out.append(message(msg.strip(), "error"))
         print(msg)
 
     def start_single_instance(self, program, indexed_name, out, is_attach):
-        """Start a single instance of a program with retry logic."""
-        startretries = program.get("startretries", 3)
-        starttime = program.get("starttime", 1)
-        exitcodes = program.get("exitcodes", [0])
-        autorestart = should_autorestart(program.get("autorestart", "unexpected"))
-
-        retry_count = 0
-        success = False
-
-        while retry_count < startretries + 1 and not success:
-            pid = None
-            master_fd = None
+        """Start a single instance of a program with retry logic; returns once it is RUNNING or FATAL."""
+        start = InstanceStart(self, program, indexed_name, out, is_attach)
+        start.attempt()
+        return start.future.result()
+
+    def start_instances(self, jobs, is_attach, generation=None):
+        """Start (program, indexed_name) jobs concurrently.
+
+        At most `max_parallel_starts` instances are in their start window or
+        backoff at once. Returns {indexed_name: (success, out)} in the order
+        the jobs were given.
+        """
+        starts = [InstanceStart(self, program, indexed_name, [], is_attach, generation)
+                  for program, indexed_name in jobs]
+        queue = deque(starts)
+        queue_lock = threading.Lock()
+
+        def launch_next(_=None):
+            with queue_lock:
+                if not queue:
+                    return
+                start = queue.popleft()
+            start.future.add_done_callback(launch_next)
+            start.attempt()
+
+        for _ in range(min(self.commands.max_parallel_starts, len(starts))):
+            launch_next()
+
+        results = {}
+        for start in starts:
             try:
-                pid, master_fd = self.start_process(program, indexed_name, is_attach)
-                alive, exit_code = self.verify_process_startup(indexed_name, pid, starttime)
-
-                if not alive:
-                    success = self.handle_process_failure(indexed_name, pid, master_fd, 
-                                                        exit_code, starttime, exitcodes, 
-                                                        retry_count, out)
-                    retry_count += 1
-                    if retry_count < startretries + 1 and autorestart and not success:
-                        print(f"\nINFO retrying: '{indexed_name}' (attempt {retry_count}/{startretries})")
-                        time.sleep(1)
-                        continue
-                    else:
-                        break
-
-                success = self.handle_process_success(program, indexed_name, pid, 
-                                                     master_fd, retry_count, starttime, out)
-
+                success = start.future.result()
             except Exception as e:
-                if master_fd:
-                    try:
-                        os.close(master_fd)
-                    except:
-                        pass
-                if pid:
-                    cleanup_failed_process(indexed_name, pid, self.commands.running_processes, self.commands.process_info)
-                retry_count += 1
-                err = f"ERR Error starting '{indexed_name}': {e}"
-                out.append(colored(err, "red"))
+                err = f"ERR Error starting '{start.indexed_name}': {e}"
+                start.out.append(message(err, "error"))
                 print(err)
-                time.sleep(1)
-
-        if not success:
-            self.handle_fatal_state(program, indexed_name, retry_count, out)
+                success = False
+            results[start.indexed_name] = (success, start.out)
+        return results
 
-        return success
-
-    def program_config(self, program, program_name, out, is_attach):
-        """Start configured program instances with retries and tracking."""
+    def instance_jobs(self, program, program_name):
+        """List the (program, indexed_name) jobs for every configured instance."""
         numprocs = program.get("numprocs", 1)
-        program["name"] = program_name
-        successful_starts = 0
+        return [
+            (program, f"{program_name}_{i:02d}" if numprocs > 1 else program_name)
+            for i in range(numprocs)
+        ]
 
-        for i in range(numprocs):
-            indexed_name = f"{program_name}_{i:02d}" if numprocs > 1 else program_name
-            if self.start_single_instance(program, indexed_name, out, is_attach):
+    def summarize_program(self, program_name, numprocs, results, out):
+        """Append the per-instance output and the overall outcome of a program start."""
+        successful_starts = 0
+        for success, instance_out in results:
+            out.extend(instance_out)
+            if success:
                 successful_starts += 1
 
         if successful_starts == 0:
-            out.append(colored(f"FATAL: '{program_name}' could not be started", "red"))
+            out.append(message(f"FATAL: '{program_name}' could not be started", "error"))
         elif successful_starts < numprocs:
             out.append(
-                colored(f"WARNING: Only {successful_starts}/{numprocs} instances of '{program_name}' started", "yellow")
+                message(f"WARNING: Only {successful_starts}/{numprocs} instances of '{program_name}' started", "warning")
             )
 
+    def program_config(self, program, program_name, out, is_attach):
+        """Start configured program instances with retries and tracking."""
+        jobs = self.instance_jobs(program, program_name)
+        results = self.start_instances(jobs, is_attach)
+        self.summarize_program(program_name, len(jobs), results.values(), out)
+
     def handle_existing_instance(self, programs, program_name, out, is_attach):
         """Handle starting an existing program instance."""
         base_program_name = self.commands.process_info[program_name].get('program_name')
@@ -160,32 +165,32 @@ class StartHandler:
         if base_program_name not in programs:
             return "not_found", f"Program config for '{base_program_name}' not found."
 
-        program = programs[base_program_name].copy()
-        program["name"] = base_program_name
+        program = programs[base_program_name]
 
         if self.start_single_instance(program, program_name, out,is_attach ):
-            out.append(colored(f"Successfully restarted '{program_name}'", "green"))
+            out.append(message(f"Successfully restarted '{program_name}'", "success"))
         else:
-            out.append(colored(f"Failed to restart '{program_name}'", "red"))
+            out.append(message(f"Failed to restart '{program_name}'", "error"))
         return "handled", None
 
     def handle_program_instances(self, programs, program_name, out, is_attach):
         """Handle starting a program's instances."""
         has_instances = False
-        started_any = False
-
-        for instance_name, info in self.commands.process_info.items():
-            if info.get('program_name') == program_name:
-                has_instances = True
-                state = info.get('state', 'UNKNOWN')
-                if state != 'RUNNING':
-                    program = programs[program_name].copy()
-                    program["name"] = program_name
-                    if self.start_single_instance(program, instance_name, out, is_attach):
-                        out.append(colored(f"Started '{instance_name}'", "green"))
-                    else:
-                        out.append(colored(f"Failed to start '{instance_name}'", "red"))
-                    started_any = True
+        jobs = []
+
+        for instance_name in self.commands.process_info.instances(program_name):
+            has_instances = True
+            state = self.commands.process_info.get(instance_name, {}).get('state', 'UNKNOWN')
+            if state != 'RUNNING':
+                jobs.append((programs[program_name], instance_name))
+
+        for instance_name, (success, instance_out) in self.start_instances(jobs, is_attach).items():
+            out.extend(instance_out)
+            if success:
+                out.append(message(f"Started '{instance_name}'", "success"))
+            else:
+                out.append(message(f"Failed to start '{instance_name}'", "error"))
+        started_any = bool(jobs)
 
         if not has_instances:
             self.program_config(programs[program_name], program_name, out, is_attach)
@@ -197,14 +202,21 @@ class StartHandler:
 
     def start_all_programs(self, programs, out, is_attach):
         """Start all configured programs."""
-        out.append(colored("Starting all programs...", "cyan"))
+        out.append(message("Starting all programs...", "info"))
+        program_jobs = {}
         for pname, pdata in programs.items():
             if pname in self.commands.running_processes and self.commands.running_processes.get(pname):
-                out.append(f"Program '{pname}' is already running.")
+                out.append(message(f"Program '{pname}' is already running."))
                 continue
+            program_jobs[pname] = self.instance_jobs(pdata, pname)
+
+        # One pool for every program, so the whole start costs about one starttime.
+        all_jobs = [job for jobs in program_jobs.values() for job in jobs]
+        results = self.start_instances(all_jobs, is_attach)
 
-            self.program_config(pdata, pname, out, is_attach)
-            out.append("")
+        for pname, jobs in program_jobs.items():
+            program_results = [results[indexed_name] for _, indexed_name in jobs]
+            self.summarize_program(pname, len(jobs), program_results, out)
 
     def start_command(self, programs, program_name=None, is_attach=False):
         """Start one or all programs, or a specific instance."""
@@ -212,16 +224,169 @@ class StartHandler:
 
         if program_name and program_name.lower() != "all":
             if program_name in self.commands.process_info:
-                status, message = self.handle_existing_instance(programs, program_name, out, is_attach)
+                status, reason = self.handle_existing_instance(programs, program_name, out, is_attach)
                 if status in ["already_running", "not_found"]:
-                    return message
+                    return [message(reason, "warning" if status == "already_running" else "error")]
             elif program_name in programs:
-                status, message = self.handle_program_instances(programs, program_name, out, is_attach)
+                status, reason = self.handle_program_instances(programs, program_name, out, is_attach)
                 if status == "all_running":
-                    return message
+                    return [message(reason, "warning")]
             else:
-                return f"Program '{program_name}' not found."
+                return [message(f"Program '{program_name}' not found.", "error")]
         else:
             self.start_all_programs(programs, out, is_attach)
 
-        return "\n".join(out) if out else "OK: start"
+        return out or [message("OK: start", "success")]
+
+
+class InstanceStart:
+    """One instance going through its start window, retried with backoff.
+
+    Nothing waits while it is in progress: the end of the start window and
+    the retries are scheduler timers, and an early exit is reported by the
+    reaper. Whichever of the timer and the exit claims the pid first
+    decides the attempt. `future` resolves to True once the instance is
+    RUNNING (or exited with an expected code), False once it is FATAL or
+    cancel() was called by a stop. The instance is recorded with
+    `generation`, by default the program's current one.
+    """
+
+    def __init__(self, handler, program, indexed_name, out, is_attach, generation=None):
+        self.handler = handler
+        self.commands = handler.commands
+        self.program = program
+        self.indexed_name = indexed_name
+        self.out = out
+        self.is_attach = is_attach
+        self.generation = self.commands.generation_of(program["name"]) if generation is None else generation
+        self.startretries = program.get("startretries", 3)
+        self.starttime = program.get("starttime", 1)
+        self.exitcodes = program.get("exitcodes", [0])
+        self.autorestart = should_autorestart(program.get("autorestart", "unexpected"))
+        self.backoff = self.commands.backoff_for(indexed_name, program)
+        self.retry_count = 0
+        self.master_fd = None
+        self.pid = None
+        self.timer = None
+        self.retry_timer = None
+        self.cancelled = False
+        # Orders cancel() against the steps of an attempt, which run on the scheduler and reaper threads.
+        self.lock = threading.RLock()
+        self.future = Future()
+        self.commands.track_start(indexed_name, self)
+
+    def cancel(self):
+        """Give up on the instance: no further attempt, no retry, no FATAL."""
+        with self.lock:
+            self.cancelled = True
+            for timer in (self.timer, self.retry_timer):
+                if timer is not None:
+                    timer.cancel()
+            pid = self.pid
+            # Unless the reaper is already deciding the attempt, nobody else will
+            # settle the outcome. A child being forked right now is stopped by
+            # attempt() once it sees the flag.
+            if pid is None or self.commands.claim_start(pid) is not None:
+                print(f"INFO cancelled: pending start of '{self.indexed_name}'")
+                self.out.append(message(f"Start of '{self.indexed_name}' was cancelled.", "warning"))
+                self.settle(False)
+
+    def settle(self, success):
+        try:
+            self.future.set_result(success)
+        except InvalidStateError:
+            return
+        self.commands.untrack_start(self.indexed_name, self)
+
+    def attempt_later(self, delay):
+        """Make the first attempt after delay seconds, unless a stop cancelled the start already."""
+        with self.lock:
+            if not self.cancelled:
+                self.retry_timer = self.commands.scheduler.call_later(delay, self.attempt)
+
+    def attempt(self):
+        with self.lock:
+            if self.cancelled:
+                self.settle(False)
+                return
+        pid = None
+        master_fd = None
+        try:
+            spawned_at = time.monotonic()
+            pid, master_fd = self.handler.start_process(self.program, self.indexed_name, self.is_attach)
+            register_process(self.commands.running_processes, self.commands.process_info,
+                             self.program["name"], self.indexed_name, pid, self.retry_count, "STARTING", master_fd,
+                             self.generation)
+        except Exception as e:
+            if master_fd:
+                pty_hub.release(master_fd)
+            if pid:
+                cleanup_failed_process(self.indexed_name, pid, self.commands.running_processes,
+                                       self.commands.process_info)
+            self.retry_count += 1
+            err = f"ERR Error starting '{self.indexed_name}': {e}"
+            self.out.append(message(err, "error"))
+            print(err)
+            self.finish(False, may_retry=True)
+            return
+
+        with self.lock:
+            self.master_fd = master_fd
+            self.pid = pid
+            if self.cancelled:
+                # A stop came in while the child was being forked and may not have seen it.
+                self.pid = None
+                threading.Thread(target=self.stop_cancelled, args=(pid,), daemon=True).start()
+                self.settle(False)
+                return
+            print(f"INFO Waiting {self.starttime}s to verify '{self.indexed_name}' is running...")
+            # Watch for the exit before arming the timer, so even with starttime 0
+            # the timer can never claim a pid whose exit nobody is watching.
+            self.commands.watch_start(pid, self, spawned_at)
+            self.timer = self.commands.scheduler.call_later(self.starttime, self.start_window_passed, pid)
+
+    def stop_cancelled(self, pid):
+        """Stop a child forked by an attempt that was cancelled meanwhile."""
+        stop_process(pid, self.program.get('stopsignal', 'TERM'), self.program.get('stoptime', 5))
+        cleanup_failed_process(self.indexed_name, pid, self.commands.running_processes, self.commands.process_info)
+        print(f"INFO stopped: '{self.indexed_name}' (pid {pid}), its start was cancelled")
+
+    def start_window_passed(self, pid):
+        """Scheduler: the instance outlived starttime."""
+        with self.lock:
+            if self.cancelled:
+                return  # cancel() claimed the pid and settled the start.
+            if self.commands.claim_start(pid) is None:
+                return  # The reaper saw it exit first.
+            self.pid = None
+            self.handler.handle_process_success(self.program, self.indexed_name, pid, self.master_fd,
+                                                self.retry_count, self.starttime, self.out, self.generation)
+            self.backoff.started()
+            self.settle(True)
+
+    def on_exit(self, pid, exit_code):
+        """Reaper: the instance died within its start window."""
+        self.pid = None
+        if self.timer is not None:
+            self.timer.cancel()
+        success = self.handler.handle_process_failure(self.indexed_name, pid, self.master_fd, exit_code,
+                                                      self.starttime, self.exitcodes, self.retry_count, self.out)
+        self.retry_count += 1
+        self.finish(success, may_retry=self.autorestart)
+
+    def finish(self, success, may_retry):
+        """Schedule the next attempt after a backoff delay, or settle the outcome."""
+        with self.lock:
+            if self.cancelled:
+                self.settle(False)
+                return
+            if not success and may_retry and self.retry_count < self.startretries + 1:
+                delay = self.backoff.next_delay()
+                print(f"\nINFO retrying: '{self.indexed_name}' (attempt {self.retry_count}/{self.startretries}) "
+                      f"in {delay:.2f}s")
+                self.retry_timer = self.commands.scheduler.call_later(delay, self.attempt)
+                return
+            if not success:
+                self.handler.handle_fatal_state(self.program, self.indexed_name, self.retry_count, self.out,
+                                                self.generation)
+            self.settle(success)
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class FeedSubscriber:
+    """One `status --watch` client, with its own queue and sender thread.
+
+    A client that falls more than max_queued events behind is disconnected
+    instead of slowing down the daemon; it resumes from its last sequence number.
+    """
+
+    def __init__(self, feed, send, on_close, max_queued):
+        self.feed = feed
+        self.send = send
+        self.on_close = on_close
+        self.max_queued = max_queued
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def push(self, line):
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.queue) >= self.max_queued:
+                self.closed = True
+            else:
+                self.queue.append(line)
+            self.condition.notify()
+
+    def run(self):
+        """Sender thread: forward queued events, batching whatever piled up."""
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    break
+                lines = list(self.queue)
+                self.queue.clear()
+            try:
+                self.send(b"".join(lines))
+            except OSError:
+                break
+        self.feed.unsubscribe(self)
+        self.on_close()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class StateFeed:
+    """Numbered stream of instance state transitions, pushed to `status --watch` clients.
+
+    Every transition gets the next sequence number, `seq` (unrelated to the
+    configuration generation of an instance). The last HISTORY events are
+    kept so a client that reconnects with `--since <epoch>:<seq>` gets
+    exactly what it missed; the epoch changes with every daemon run, so
+    numbers from an earlier run are never mistaken for current ones.
+    """
+
+    HISTORY = 1024
+    SUBSCRIBER_QUEUE = 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.epoch = f"{os.getpid()}.{int(time.time())}"
+        self.seq = 0
+        self.history = deque(maxlen=self.HISTORY)
+        self.subscribers = []
+
+    def publish(self, indexed_name, old_state, record):
+        """ProcessTable listener: turn one state change into an event line."""
+        with self.lock:
+            self.seq += 1
+            event = {
+                "seq": self.seq,
+                "time": time.time(),
+                "name": indexed_name,
+                "program": record.program_name,
+                "from": old_state,
+                "to": record.state,
+                "pid": record.pid,
+                "exit_code": record.exit_code,
+            }
+            line = (json.dumps(event) + "\n").encode('utf-8')
+            self.history.append((self.seq, line))
+            for subscriber in self.subscribers:
+                subscriber.push(line)
+
+    def parse_since(self, since):
+        """Return the sequence number to resume after, or None if `since` is not from this run."""
+        epoch, _, seq = (since or "").partition(":")
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(seq)
+        except ValueError:
+            return None
+
+    def subscribe(self, send, on_close, since=None):
+        """Add a watcher; returns (subscriber, seq, resumed).
+
+        When `since` can be resumed the missed events are queued first;
+        otherwise resumed is False and the client should refresh its view
+        with a full `status` before applying new events.
+        """
+        after = self.parse_since(since)
+        with self.lock:
+            oldest = self.history[0][0] if self.history else self.seq + 1
+            resumed = after is not None and oldest - 1 <= after <= self.seq
+            subscriber = FeedSubscriber(self, send, on_close, self.SUBSCRIBER_QUEUE)
+            if resumed:
+                for seq, line in self.history:
+                    if seq > after:
+                        subscriber.push(line)
+            self.subscribers.append(subscriber)
+            seq = self.seq
+
+        threading.Thread(target=subscriber.run, name="status-watch", daemon=True).start()
+        return subscriber, seq, resumed
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+        subscriber.close()
@@ -1,6 +1,6 @@
 import os
 import time
-from termcolor import colored
+from pty_hub import hub as pty_hub
 
 class StatusHandler:
     def __init__(self, commands_instance):
@@ -14,57 +14,59 @@ class StatusHandler:
         if state not in ['STOPPED', 'FATAL'] and pid and pid != 0:
             try:
                 os.kill(pid, 0)
-                state = 'RUNNING'
             except ProcessLookupError:
                 state = 'STOPPED'
-                self.commands.process_info[key]['state'] = 'STOPPED'
-                self.commands.process_info[key]['pid'] = 0
-                master_fd = self.commands.process_info[key].get('master_fd')
+                master_fd = info.get('master_fd')
                 if master_fd:
-                    try:
-                        os.close(master_fd)
-                    except:
-                        pass
-                    self.commands.process_info[key]['master_fd'] = None
+                    pty_hub.release(master_fd)
+                self.commands.process_info.update(key, state='STOPPED', pid=0, master_fd=None)
 
         return state, pid
 
-    def format_status_string(self, state, pid=None, start_time=None):
-        """Format the status string with appropriate colors and information."""
-        if state == 'RUNNING':
-            status_color = 'green'
-            uptime = int(time.time() - (start_time or time.time()))
-            return f"{colored(state, status_color)} (pid {pid}, uptime {uptime}s)"
-        elif state in ['FATAL', 'STOPPED']:
-            status_color = 'red'
-            return colored(state, status_color)
-        else:
-            status_color = 'yellow'
-            return colored(state, status_color)
+    def instance_status(self, name, program_name, info=None):
+        """Describe one instance: state, pid, uptime, retries, exit code, last message, generation and last resource sample."""
+        if info is None:
+            return {"name": name, "program": program_name, "state": "STOPPED", "pid": None,
+                    "uptime": None, "retries": 0, "exit_code": None, "message": None,
+                    "generation": self.commands.generation_of(program_name),
+                    "cpu_seconds": None, "rss_bytes": None}
 
-    def get_program_status_lines(self, pname):
-        """Get status lines for a specific program."""
-        status_lines = []
-        has_instances = False
+        state, pid = self.check_and_update_process_state(name, info)
+        uptime = None
+        if state == 'RUNNING' and info.get('start_time'):
+            uptime = int(time.time() - info.get('start_time'))
+        sample = self.commands.sampler.get(name) if state == 'RUNNING' else None
+        if sample is not None and sample.pid != pid:
+            sample = None
+        return {
+            "name": name,
+            "program": program_name,
+            "state": state,
+            "pid": pid or None,
+            "uptime": uptime,
+            "retries": info.get('retries', 0),
+            "exit_code": info.get('exit_code'),
+            "message": info.get('message'),
+            "generation": info.get('generation'),
+            "cpu_seconds": sample.cpu_seconds if sample else None,
+            "rss_bytes": sample.rss_bytes if sample else None,
+        }
 
-        for key, info in sorted(self.commands.process_info.items()):
-            if info.get('program_name') == pname:
-                has_instances = True
-                state, pid = self.check_and_update_process_state(key, info)
-                status_str = self.format_status_string(state, pid, info.get('start_time'))
-                status_lines.append(f"- {key}: {status_str}")
+    def get_program_status(self, pname):
+        """Status of every instance of a program, or a single STOPPED entry if it has none."""
+        statuses = []
+        for key in self.commands.process_info.instances(pname):
+            info = self.commands.process_info.get(key)
+            if info is not None:
+                statuses.append(self.instance_status(key, pname, info))
 
-        if not has_instances:
-            status_lines.append(f"- {pname}: {colored('STOPPED', 'red')}")
-
-        return status_lines
+        if not statuses:
+            statuses.append(self.instance_status(pname, pname))
+        return statuses
 
     def status_command(self, programs):
-        """Display the current status of all programs."""
-        out = []
-        out.append(colored("Program status:", 'cyan', attrs=['underline']))
-
+        """Current status of all programs, one entry per instance."""
+        instances = []
         for pname in programs:
-            out.extend(self.get_program_status_lines(pname))
-
-        return "\n".join(out)
\ No newline at end of file
+            instances.extend(self.get_program_status(pname))
+        return {"instances": instances}
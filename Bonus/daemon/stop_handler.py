@@ -1,7 +1,7 @@
-import os
 import signal
-from termcolor import colored
-from helper import stop_process
+from pty_hub import hub as pty_hub
+from helper import stop_process_group
+from reply import message
 
 class StopHandler:
     def __init__(self, commands_instance):
@@ -31,12 +31,12 @@ class StopHandler:
             return [(indexed_name, pid, master_fd)], None
 
         pids_to_stop = []
-        for indexed_name, info in list(self.commands.process_info.items()):
-            if info.get('program_name') == pname:
-                pid = info.get('pid')
-                master_fd = info.get('master_fd')
-                if pid and pid != 0:
-                    pids_to_stop.append((indexed_name, pid, master_fd))
+        for indexed_name in self.commands.process_info.instances(pname):
+            info = self.commands.process_info.get(indexed_name, {})
+            pid = info.get('pid')
+            master_fd = info.get('master_fd')
+            if pid and pid != 0:
+                pids_to_stop.append((indexed_name, pid, master_fd))
 
         if not pids_to_stop:
             return None, f"{pname} is already stopped."
@@ -54,22 +54,43 @@ class StopHandler:
             return stopsignal_name, getattr(signal, f"SIG{stopsignal_name}", signal.SIGTERM)
         return stopsignal_name, stopsignal_name
 
-    def stop_processes(self, pids_to_stop, stopsignal, stoptime):
-        """Stop a list of processes and clean up their resources."""
-        for indexed_name, pid, master_fd in pids_to_stop:
-            print(f"waiting for {indexed_name} (pid {pid}) to stop...")
-            stop_process(pid, stopsignal, stoptime)
+    def stop_processes(self, batches):
+        """Stop every process of every batch together and clean up their resources.
+
+        batches is a list of (pids_to_stop, stopsignal, stoptime), one per program.
+        """
+        targets = []
+        for pids_to_stop, stopsignal, stoptime in batches:
+            for indexed_name, pid, master_fd in pids_to_stop:
+                print(f"waiting for {indexed_name} (pid {pid}) to stop...")
+                self.commands.process_info.update(indexed_name, state='STOPPING')
+                targets.append((pid, stopsignal, stoptime))
+
+        for pid in stop_process_group(targets):
+            print(f"WARN killed: pid {pid} did not stop in time, sent SIGKILL")
 
-            if master_fd:
-                try:
-                    os.close(master_fd)
-                except:
-                    pass
+        for pids_to_stop, _, _ in batches:
+            for indexed_name, pid, master_fd in pids_to_stop:
+                if master_fd:
+                    pty_hub.release(master_fd)
 
-            if indexed_name in self.commands.process_info:
-                self.commands.process_info[indexed_name]['state'] = 'STOPPED'
-                self.commands.process_info[indexed_name]['pid'] = 0
-                self.commands.process_info[indexed_name]['master_fd'] = None
+                self.commands.process_info.update(indexed_name, state='STOPPED', pid=0, master_fd=None)
+
+    def stop_instances(self, program, names, isReload=False):
+        """Stop some instances of a program together, with its stop (or reload) signal."""
+        pids_to_stop = []
+        for key in names:
+            self.commands.cancel_start(key)
+            info = self.commands.process_info.get(key)
+            if info is not None and info.pid:
+                pids_to_stop.append((key, info.pid, info.master_fd))
+        _, stopsignal = self.get_stop_signal(program, isReload)
+        self.stop_processes([(pids_to_stop, stopsignal, program.get('stoptime', 5))])
+
+        program_pids = self.commands.running_processes.get(program["name"], [])
+        for _, pid, _ in pids_to_stop:
+            if pid in program_pids:
+                program_pids.remove(pid)
 
     def update_running_processes(self, pname, program_name, indexed_name):
         """Update the running_processes list after stopping processes."""
@@ -88,12 +109,18 @@ class StopHandler:
         
         target_programs, error = self.get_target_programs(programs, program_name)
         if error:
-            return error
+            return [message(error, "error")]
 
+        stopping = []
         for pname, pdata in target_programs.items():
+            for indexed_name in ([program_name] if program_name and program_name.lower() != 'all'
+                                 else self.commands.process_info.instances(pname)):
+                # A stop request also cancels a pending autorestart or a start in flight.
+                self.commands.cancel_start(indexed_name)
+
             pids_to_stop, error = self.get_pids_to_stop(pname, program_name)
             if error:
-                out.append(error)
+                out.append(message(error, "warning"))
                 print(error)
                 continue
 
@@ -102,13 +129,16 @@ class StopHandler:
 
             stop_msg = f"Stopping '{program_name}' with signal {stopsignal_name}..." if program_name and program_name.lower() != 'all' else f"Stopping program '{pname}' with signal {stopsignal_name}..."
             print(stop_msg)
+            stopping.append((pname, pids_to_stop, stopsignal, stoptime))
+
+        # Signal every program first and wait for all of them at once.
+        self.stop_processes([(pids, sig, stoptime) for _, pids, sig, stoptime in stopping])
 
-            self.stop_processes(pids_to_stop, stopsignal, stoptime)
-            
+        for pname, pids_to_stop, _, _ in stopping:
             self.update_running_processes(pname, program_name, pids_to_stop[0][0] if pids_to_stop else None)
 
             success_msg = f"Process '{program_name}' stopped." if program_name and program_name.lower() != 'all' else f"Program '{pname}' stopped."
-            out.append(success_msg)
+            out.append(message(success_msg, "success"))
             print(success_msg)
 
-        return "\n".join(out)
\ No newline at end of file
+        return out
\ No newline at end of file
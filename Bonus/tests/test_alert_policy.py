@@ -0,0 +1,84 @@
+"""AlertPolicy rate limiting, with its quiet periods run by hand.
+
+Run from the repository root: python -m unittest discover -s Bonus/tests
+"""
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'daemon'))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'common'))
+
+import alert_policy
+from alert_policy import AlertPolicy
+from scheduler import Timer
+
+
+class ManualScheduler:
+    """Records call_later() calls; run_all() fires the ones still pending."""
+
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(delay, callback, args)
+        self.timers.append(timer)
+        return timer
+
+    def run_all(self):
+        timers, self.timers = self.timers, []
+        for timer in timers:
+            if not timer.cancelled:
+                timer.callback(*timer.args)
+
+
+class RecordingAlerter:
+    def __init__(self):
+        self.sent = []
+
+    def send_alert(self, subject, message, severity="INFO"):
+        self.sent.append(subject)
+
+
+class AlertPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.logged = []
+        original = alert_policy.log_event
+        alert_policy.log_event = lambda event, message, **fields: self.logged.append((message, fields))
+        self.addCleanup(setattr, alert_policy, 'log_event', original)
+        self.scheduler = ManualScheduler()
+        self.alerter = RecordingAlerter()
+        self.policy = AlertPolicy(self.alerter, self.scheduler)
+
+    def died(self):
+        return self.policy.notify("worker_03", "PROCESS_DIED", "died", subject="died", severity="ERROR")
+
+    def test_burst_goes_through_then_events_are_counted(self):
+        delivered = [self.died() for _ in range(AlertPolicy.BURST + 4)]
+        self.assertEqual(delivered, [True] * AlertPolicy.BURST + [False] * 4)
+        self.assertEqual(len(self.scheduler.timers), 1)
+
+        self.scheduler.run_all()
+        summaries = [fields for _, fields in self.logged if fields.get('summary')]
+        self.assertEqual([fields['suppressed'] for fields in summaries], [4])
+        self.assertEqual(self.alerter.sent[-1], "'worker_03' died unexpectedly 4 times in 0 s")
+
+    def test_quiet_period_without_events_sends_no_summary(self):
+        for _ in range(AlertPolicy.BURST):
+            self.died()
+        self.scheduler.run_all()
+        self.assertFalse([fields for _, fields in self.logged if fields.get('summary')])
+        self.assertEqual(len(self.alerter.sent), AlertPolicy.BURST)
+        self.assertEqual(self.policy.states[("worker_03", "PROCESS_DIED")].quiet_level, 0)
+
+    def test_forget_cancels_the_quiet_period(self):
+        for _ in range(AlertPolicy.BURST + 1):
+            self.died()
+        self.policy.forget("worker_03")
+        self.scheduler.run_all()
+        self.assertFalse([fields for _, fields in self.logged if fields.get('summary')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+"""EmailAlerter against a local SMTP stand-in.
+
+Run from the repository root: python -m unittest discover -s Bonus/tests
+"""
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'daemon'))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'common'))
+
+import helper
+from alert_policy import AlertPolicy
+from scheduler import Scheduler
+from sendEmail import EmailAlerter
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimal plain-SMTP server that records sessions and messages.
+
+    delay holds every DATA reply back for that many seconds; fail_data is a
+    list of actions for the next DATA commands: "drop" closes the connection,
+    "reject" answers 554.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPSession)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self.delay = 0.0
+        self.fail_data = []
+        self.received = threading.Condition(self.lock)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def wait_for_messages(self, count, timeout=5.0):
+        with self.received:
+            return self.received.wait_for(lambda: len(self.messages) >= count, timeout)
+
+
+class SMTPSession(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stand-in ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode().strip().split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-stand-in")
+                self.reply("250 AUTH PLAIN")
+            elif verb == "AUTH":
+                self.reply("235 accepted")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 ok")
+            elif verb == "DATA":
+                with server.lock:
+                    action = server.fail_data.pop(0) if server.fail_data else None
+                if action == "drop":
+                    return
+                self.reply("354 go ahead")
+                body = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b".\r\n":
+                        break
+                    body.append(data.decode())
+                time.sleep(server.delay)
+                if action == "reject":
+                    self.reply("554 rejected")
+                    continue
+                with server.received:
+                    server.messages.append("".join(body))
+                    server.received.notify_all()
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 unknown")
+
+
+class EmailAlerterTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SMTPStandIn()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.logdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.logdir.cleanup)
+        helper.event_log.path = os.path.join(self.logdir.name, "events.jsonl")
+
+    def alerter(self, digest_window=0.0, **kwargs):
+        config = {
+            'smtp_server': "127.0.0.1", 'smtp_port': self.server.port, 'smtp_ssl': False,
+            'username': "taskmaster@localhost", 'password': "secret", 'recipients': ["ops@localhost"],
+        }
+        alerter = EmailAlerter(digest_window, config=config, **kwargs)
+        self.addCleanup(alerter.close)
+        return alerter
+
+    def test_notify_does_not_wait_for_a_slow_server(self):
+        self.server.delay = 1.0
+        policy = AlertPolicy(self.alerter(), Scheduler())
+        started = time.monotonic()
+        for index in range(3):
+            policy.notify(f"worker_{index:02d}", "PROCESS_DIED", "died", subject="died", severity="ERROR")
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertTrue(self.server.wait_for_messages(1))
+
+    def test_alerts_within_the_window_make_one_digest(self):
+        alerter = self.alerter(digest_window=0.5)
+        for index in range(5):
+            alerter.send_alert(f"worker_{index:02d} failed", "died", "WARNING" if index else "CRITICAL")
+        self.assertTrue(self.server.wait_for_messages(1))
+        time.sleep(0.3)
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertIn("5 alerts (CRITICAL)", self.server.messages[0])
+        self.assertIn("worker_04 failed", self.server.messages[0])
+
+    def test_one_session_carries_every_message(self):
+        alerter = self.alerter()
+        for index in range(3):
+            alerter.send_alert(f"alert {index}", "message")
+            self.assertTrue(self.server.wait_for_messages(index + 1))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_dropped_session_is_reopened_and_the_message_resent(self):
+        alerter = self.alerter()
+        self.server.fail_data = ["drop"]
+        alerter.send_alert("first", "message")
+        self.assertTrue(self.server.wait_for_messages(1))
+        self.assertEqual(self.server.connections, 2)
+
+    def test_rejected_message_is_dropped_and_the_worker_keeps_going(self):
+        alerter = self.alerter()
+        self.server.fail_data = ["reject"]
+        alerter.send_alert("rejected", "message")
+        alerter.send_alert("accepted", "message")
+        self.assertTrue(self.server.wait_for_messages(1))
+        time.sleep(0.2)
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertIn("accepted", self.server.messages[0])
+        self.assertTrue(alerter.thread.is_alive())
+
+    def test_alert_that_cannot_be_composed_does_not_stop_the_worker(self):
+        alerter = self.alerter()
+        alerter.send_alert("broken\nsubject", "message")  # Not a valid header value.
+        time.sleep(0.2)
+        alerter.send_alert("accepted", "message")
+        self.assertTrue(self.server.wait_for_messages(1))
+        self.assertIn("accepted", self.server.messages[0])
+        self.assertTrue(alerter.thread.is_alive())
+
+    def test_full_queue_drops_alerts_and_reports_them(self):
+        self.server.delay = 0.5
+        alerter = self.alerter(max_queued_alerts=2)
+        alerter.send_alert("first", "message")
+        time.sleep(0.2)  # The worker is now stuck on the slow server.
+        for index in range(5):
+            alerter.send_alert(f"queued {index}", "message")
+        self.assertEqual(alerter.dropped, 3)
+        self.assertTrue(self.server.wait_for_messages(2))
+        self.assertIn("3 more alert(s) were dropped", self.server.messages[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
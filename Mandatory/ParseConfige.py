@@ -1,4 +1,5 @@
 import yaml
+from program_spec import ProgramSpec
 import os
 import sys
 
@@ -14,7 +15,10 @@ class ConfigParser:
     VALID_FIELDS = [
         'cmd', 'numprocs', 'autostart', 'autorestart', 'exitcodes',
         'starttime', 'startretries', 'stopsignal', 'stoptime', 'stdout',
-        'stderr', 'env', 'workingdir', 'umask'
+        'stderr', 'env', 'workingdir', 'umask',
+        'stdout_logfile_maxbytes', 'stdout_logfile_backups', 'stdout_logfile_maxage',
+        'stderr_logfile_maxbytes', 'stderr_logfile_backups', 'stderr_logfile_maxage',
+        'backoff_base', 'backoff_multiplier', 'backoff_max', 'backoff_reset'
     ]
     # DEFAULT_CONFIG = {
     #     'numprocs': 1,
@@ -136,6 +140,24 @@ class ConfigParser:
                 parsed['stderr'] = ConfigParser._validate_file_path(
                     config['stderr'], 'stderr')
 
+            for stream in ('stdout', 'stderr'):
+                field = f'{stream}_logfile_maxbytes'
+                if field in config:
+                    parsed[field] = ConfigParser._validate_byte_size(config[field], field)
+
+                field = f'{stream}_logfile_backups'
+                if field in config:
+                    parsed[field] = ConfigParser._validate_non_negative_int(config[field], field)
+
+                field = f'{stream}_logfile_maxage'
+                if field in config:
+                    parsed[field] = ConfigParser._validate_non_negative_int(config[field], field)
+
+            for field, minimum in (('backoff_base', 0), ('backoff_multiplier', 1),
+                                   ('backoff_max', 0), ('backoff_reset', 0)):
+                if field in config:
+                    parsed[field] = ConfigParser._validate_number(config[field], field, minimum)
+
             if 'env' in config:
                 parsed['env'] = ConfigParser._validate_env(config['env'])
 
@@ -146,7 +168,7 @@ class ConfigParser:
             if 'umask' in config:
                 parsed['umask'] = ConfigParser._validate_umask(config['umask'])
 
-            return parsed
+            return ProgramSpec(name, **parsed)
         except Exception as e:
             print(f"Error: {e}", file=sys.stderr)
             sys.exit(1)
@@ -239,6 +261,42 @@ class ConfigParser:
 
         return value
 
+    def _validate_number(value, field_name, minimum=0):
+        """Validate a number (int or float) of at least minimum"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ConfigError(f"'{field_name}' must be a number")
+
+        if value < minimum:
+            raise ConfigError(f"'{field_name}' must be at least {minimum}")
+
+        return value
+
+    def _validate_byte_size(value, field_name):
+        """Validate a size in bytes, either an integer or a string like '50MB'"""
+        if isinstance(value, bool):
+            raise ConfigError(f"'{field_name}' must be a size in bytes")
+
+        if isinstance(value, str):
+            text = value.strip().upper()
+            multiplier = 1
+            for suffix, factor in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024)):
+                if text.endswith(suffix):
+                    text, multiplier = text[:-len(suffix)].strip(), factor
+                    break
+            try:
+                value = int(text) * multiplier
+            except ValueError:
+                raise ConfigError(
+                    f"'{field_name}' must be a size like 1024, '512KB' or '50MB': {value}")
+
+        if not isinstance(value, int):
+            raise ConfigError(f"'{field_name}' must be a size in bytes")
+
+        if value < 0:
+            raise ConfigError(f"'{field_name}' cannot be negative")
+
+        return value
+
     def _validate_signal(value):
         """Validate signal name"""
         if not isinstance(value, str):
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import os
 import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
 from supervisor import Supervisor
 from termcolor import colored
 from init import init
@@ -1,5 +1,7 @@
 import errno
+import heapq
 import os
+import selectors
 import signal
 import subprocess
 import sys
@@ -9,6 +11,19 @@ import json
 from termcolor import colored
 
 from ParseConfige import ConfigParser
+from log_writer import RotatingFile, LogPump, DEFAULT_MAXBYTES, DEFAULT_BACKUPS
+from event_log import EventLog
+from backoff import Backoff
+
+
+def _open_pidfd(pid):
+    """Return a pidfd for pid, or None if this kernel or Python has no pidfd support."""
+    if not hasattr(os, 'pidfd_open'):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
 
 
 class Supervisor:
@@ -16,6 +31,18 @@ class Supervisor:
         self.programs = programs
         self.start_series = {}
         self.child_pids = {}
+        # pid -> (program, worker), so a reaped pid is matched in O(1).
+        self.pid_programs = {}
+        # Exits are seen through pidfds and restarts wait in a timer heap,
+        # both served by the _monitor loop. Children without a pidfd are
+        # polled with waitpid(WNOHANG) instead.
+        self.selector = selectors.DefaultSelector()
+        self.polled_pids = set()
+        # Backoffs and pending restarts are per worker, so one crash-looping
+        # instance never delays its siblings.
+        self.backoffs = {}
+        self.restart_timers = []
+        self.pending_restarts = set()
         self.config_file_name = config_file_name
         self.state_dir = '/tmp/taskmaster_states'
         if not os.path.isdir(self.state_dir):
@@ -23,10 +50,8 @@ class Supervisor:
                 os.makedirs(self.state_dir, exist_ok=True)
             except OSError as e:
                 print(f"Failed to create state dir {self.state_dir}: {e}", file=sys.stderr)
-        self.log_file = '../logs/task_master.log'
-        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
-        with open(self.log_file, 'a'):
-            pass
+        self.log_file = '../logs/task_master.jsonl'
+        self.event_log = EventLog(self.log_file)
     
     
     def supervise(self, cmd):
@@ -58,7 +83,8 @@ class Supervisor:
             if value.get('autostart', True) :
                 self.start(key)
     
-    def start(self, arg, restart=False):
+    def start(self, arg, restart=False, worker=None):
+        """Start the workers of one or all programs; a restart may target a single worker."""
         for key, value in self.programs.items():
             if not (arg == key or arg is None or arg == "all"):
                 continue
@@ -68,6 +94,8 @@ class Supervisor:
 
             for i in range(value.get('numprocs', 1)):
                 worker_name = f"{key}:{key}_{i}" if value.get('numprocs', 1) > 1 else key
+                if worker is not None and worker_name != worker:
+                    continue
                 if restart:
                     self.start_series[worker_name] -= 1
                 if not restart:
@@ -98,7 +126,15 @@ class Supervisor:
                     self._worker(key, worker_name)
                 else:
                     self.child_pids[key] = pid
-        if self.child_pids:
+                    self.pid_programs[pid] = (key, worker_name)
+                    pidfd = _open_pidfd(pid)
+                    if pidfd is None:
+                        self.polled_pids.add(pid)
+                    else:
+                        self.selector.register(pidfd, selectors.EVENT_READ, pid)
+                    self._backoff(key, worker_name).started()
+        # Restarts come from the _monitor loop itself, which keeps running.
+        if self.child_pids and not restart:
             self._monitor()
 
     def status(self, arg):
@@ -271,7 +307,7 @@ class Supervisor:
 
             env = os.environ.copy()
             prog_env = self.programs[worker].get('env')
-            if isinstance(prog_env, dict):
+            if prog_env:
                 for k, v in prog_env.items():
                     env[str(k)] = str(v)
             
@@ -286,19 +322,28 @@ class Supervisor:
             
             os.makedirs(os.path.dirname(stdout_path) if os.path.dirname(stdout_path) else './logs', exist_ok=True)
 
-            with open(stdout_path, 'a') as stdout_file, open(stderr_path, 'a') as stderr_file:
-                process = subprocess.Popen(
-                    cmd.split(),
-                    stdout=stdout_file,
-                    stderr=stderr_file,
-                    text=True,
-                    env=env
-                )
+            # The program writes into pipes we own; the pump thread writes and
+            # rotates the log files so the program never waits on the disk.
+            pump = LogPump()
+            out_read, out_write = os.pipe()
+            err_read, err_write = os.pipe()
+            pump.add(out_read, self._log_file(worker, 'stdout', stdout_path))
+            pump.add(err_read, self._log_file(worker, 'stderr', stderr_path))
+            process = subprocess.Popen(
+                cmd.split(),
+                stdout=out_write,
+                stderr=err_write,
+                env=env
+            )
+            os.close(out_write)
+            os.close(err_write)
+            pump.start()
             self._write_worker_state(worker_name=worker_name, pid=process.pid)
 
             print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - INFO {worker_name} started with pid {process.pid}", file=sys.stdout, flush=True)
             self._log(f"{worker_name} started with pid {process.pid}")
             exit_code = process.wait()
+            pump.join(1.0)
             end_time = time.perf_counter()
             status_message = ""
             elapsed_time = end_time - start_time
@@ -330,6 +375,16 @@ class Supervisor:
 
             sys.exit(1)
 
+    def _log_file(self, worker, stream, path):
+        """Build the rotating log for a worker's 'stdout' or 'stderr'"""
+        config = self.programs[worker]
+        return RotatingFile(
+            path,
+            config.get(f'{stream}_logfile_maxbytes', DEFAULT_MAXBYTES),
+            config.get(f'{stream}_logfile_backups', DEFAULT_BACKUPS),
+            config.get(f'{stream}_logfile_maxage', 0)
+        )
+
     def _should_restart(self, worker_name, exit_code):
         """Determine if a worker should be restarted based on its configuration"""
         config = self.programs.get(worker_name)
@@ -346,41 +401,74 @@ class Supervisor:
         else:  # 'never'
             return False
 
+    def _backoff(self, program_name, worker_name):
+        """Restart backoff of a worker, kept across restarts"""
+        if worker_name not in self.backoffs:
+            self.backoffs[worker_name] = Backoff.from_config(self.programs[program_name])
+        return self.backoffs[worker_name]
+
     def _monitor(self):
-        """Monitor child processes and handle their exit"""
+        """Monitor child processes, handle their exit and run due restarts"""
         try:
-            while self.child_pids:
-                try:
-                    pid, status = os.waitpid(-1, 0)  # Changed to blocking wait
-                    
-                    if os.WIFEXITED(status):
-                        exit_code = os.WEXITSTATUS(status)
-                    elif os.WIFSIGNALED(status):
-                        exit_code = 128 + os.WTERMSIG(status)
-                    else:
-                        exit_code = 1
-                    
-                    # Find which program this PID belongs to
-                    program_name = None
-                    for prog, prog_pid in self.child_pids.items():
-                        if prog_pid == pid:
-                            program_name = prog
-                            break
-                    
-                    if program_name:
-                        del self.child_pids[program_name]
-                        if self._should_restart(program_name, exit_code) and self.programs[program_name].get('startretries', 0) > 0:
-                            time.sleep(0.5)  # Brief delay before restart
-                            self.start(program_name, restart=True)
-                        
-                except ChildProcessError:
-                    # No more children
-                    break
-                    
+            while self.pid_programs or self.restart_timers:
+                # Block until a child exits or the next restart is due.
+                timeout = None
+                if self.restart_timers:
+                    timeout = max(0.0, self.restart_timers[0][0] - time.monotonic())
+                if self.polled_pids:
+                    timeout = 0.1 if timeout is None else min(timeout, 0.1)
+                for key, _ in self.selector.select(timeout):
+                    self.selector.unregister(key.fileobj)
+                    os.close(key.fd)
+                    self._child_exited(key.data)
+
+                for pid in list(self.polled_pids):
+                    try:
+                        reaped, status = os.waitpid(pid, os.WNOHANG)
+                    except ChildProcessError:
+                        reaped, status = pid, None
+                    if reaped:
+                        self.polled_pids.discard(pid)
+                        self._child_exited(pid, status)
+
+                while self.restart_timers and self.restart_timers[0][0] <= time.monotonic():
+                    _, worker_name, program_name = heapq.heappop(self.restart_timers)
+                    self.pending_restarts.discard(worker_name)
+                    self.start(program_name, restart=True, worker=worker_name)
+
         except KeyboardInterrupt:
             print(f"\n{time.strftime('%Y-%m-%d %H:%M:%S')} - Shutting down supervisor...")
             self.stop(None)
 
+    def _child_exited(self, pid, status=None):
+        """Reap a child that exited (unless already reaped with status) and schedule its restart if needed"""
+        if status is None:
+            try:
+                _, status = os.waitpid(pid, 0)
+            except ChildProcessError:
+                status = None
+
+        if status is not None and os.WIFEXITED(status):
+            exit_code = os.WEXITSTATUS(status)
+        elif status is not None and os.WIFSIGNALED(status):
+            exit_code = 128 + os.WTERMSIG(status)
+        else:
+            exit_code = 1
+
+        # Find which worker this PID belongs to
+        program_name, worker_name = self.pid_programs.pop(pid, (None, None))
+
+        if program_name:
+            if self.child_pids.get(program_name) == pid:
+                del self.child_pids[program_name]
+            if (self._should_restart(program_name, exit_code)
+                    and self.programs[program_name].get('startretries', 0) > 0
+                    and worker_name not in self.pending_restarts):
+                delay = self._backoff(program_name, worker_name).next_delay()
+                self._log(f"{worker_name} exited with code {exit_code}, restarting in {delay:.2f}s")
+                heapq.heappush(self.restart_timers, (time.monotonic() + delay, worker_name, program_name))
+                self.pending_restarts.add(worker_name)
+
     
     def _write_worker_state(self, worker_name, pid=None, exit_code=None, message=None):
         """Write worker state to a file"""
@@ -457,10 +545,6 @@ class Supervisor:
                 pass
         return None
     
-    def _log(self, log_message):
-        try:
-            with open(self.log_file, 'a') as f:
-                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {log_message}\n")
-        except OSError as e:
-            print(f"Failed to write to log file {self.log_file}: {e}", file=sys.stderr)
+    def _log(self, log_message, event="SUPERVISOR"):
+        self.event_log.log(event, log_message)
 
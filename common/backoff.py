@@ -0,0 +1,59 @@
+import random
+import time
+
+DEFAULT_BASE = 1.0
+DEFAULT_MULTIPLIER = 2.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_RESET_AFTER = 60.0
+
+
+class Backoff:
+    """Restart delays of one instance: exponential, capped, with full jitter.
+
+    The n-th delay is drawn uniformly from [0, min(max_delay, base * multiplier**n)],
+    so instances that failed together (say, on a shared database going down)
+    spread their retries out instead of hitting it in lockstep. An instance
+    that stayed up for reset_after seconds starts over from base.
+    """
+
+    def __init__(self, base=DEFAULT_BASE, multiplier=DEFAULT_MULTIPLIER,
+                 max_delay=DEFAULT_MAX_DELAY, reset_after=DEFAULT_RESET_AFTER):
+        self.base = base
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.reset_after = reset_after
+        self.attempt = 0
+        self.started_at = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Backoff configured by a program's backoff_* options."""
+        return cls(
+            config.get('backoff_base', DEFAULT_BASE),
+            config.get('backoff_multiplier', DEFAULT_MULTIPLIER),
+            config.get('backoff_max', DEFAULT_MAX_DELAY),
+            config.get('backoff_reset', DEFAULT_RESET_AFTER)
+        )
+
+    def started(self):
+        """The instance was (re)started; it counts as stable reset_after seconds from now."""
+        self.started_at = time.monotonic()
+
+    def stable(self):
+        """True if the instance has been up for reset_after seconds since it was last started."""
+        return self.started_at is not None and time.monotonic() - self.started_at >= self.reset_after
+
+    def next_delay(self):
+        """Seconds to wait before the next restart."""
+        if self.stable():
+            self.attempt = 0
+        self.started_at = None
+        ceiling = min(self.max_delay, self.base * self.multiplier ** self.attempt)
+        if ceiling < self.max_delay:
+            # Once capped, the exponent no longer matters (and must not overflow).
+            self.attempt += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self):
+        self.attempt = 0
+        self.started_at = None
@@ -0,0 +1,106 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+FSYNC_MODES = ("never", "flush", "always")
+
+
+class EventLog:
+    """Structured event log shared by taskmasterd and the mandatory supervisor.
+
+    Every event becomes one JSON line carrying both wall-clock and monotonic
+    timestamps. Lines are buffered in memory and written through a single
+    persistent file handle once flush_bytes are pending, every flush_interval
+    seconds, and at interpreter exit. fsync is one of FSYNC_MODES: never,
+    after every flush, or after every event (which also flushes every event).
+    """
+
+    def __init__(self, path, flush_bytes=64 * 1024, flush_interval=1.0, fsync="never"):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_MODES)}")
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fd = None
+        self._reset()
+        atexit.register(self.close)
+        # A forked child must neither inherit the parent's pending lines
+        # (they would be written twice) nor a lock held by another thread.
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.condition = threading.Condition()
+        self.pending = []
+        self.pending_bytes = 0
+        self.thread = None
+
+    def log(self, event, message, **fields):
+        """Buffer one event; extra keyword fields are added to the record."""
+        record = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "monotonic": round(time.monotonic(), 6),
+            "pid": os.getpid(),
+            "event": event,
+            "message": message,
+        }
+        record.update(fields)
+        line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+
+        with self.condition:
+            self.pending.append(line)
+            self.pending_bytes += len(line)
+            if self.fsync == "always" or self.pending_bytes >= self.flush_bytes:
+                self._flush_locked()
+            elif self.thread is None:
+                self.thread = threading.Thread(target=self._flusher, name="event-log", daemon=True)
+                self.thread.start()
+            elif len(self.pending) == 1:
+                self.condition.notify()
+
+    def flush(self):
+        with self.condition:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        data = b"".join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        try:
+            if self.fd is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            view = memoryview(data)
+            while view:
+                written = os.write(self.fd, view)
+                view = view[written:]
+            if self.fsync != "never":
+                os.fsync(self.fd)
+        except OSError as e:
+            print(f"Warning: Could not write to event log {self.path}: {e}")
+
+    def _flusher(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                # Let the batch grow for one interval before writing it.
+                self.condition.wait(self.flush_interval)
+                self._flush_locked()
+
+    def close(self):
+        """Flush whatever is pending and close the file."""
+        with self.condition:
+            self._flush_locked()
+            if self.fd is not None:
+                try:
+                    os.close(self.fd)
+                except OSError:
+                    pass
+                self.fd = None
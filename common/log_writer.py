@@ -0,0 +1,135 @@
+import os
+import selectors
+import threading
+import time
+
+DEFAULT_MAXBYTES = 50 * 1024 * 1024
+DEFAULT_BACKUPS = 10
+
+
+class RotatingFile:
+    """Append-only log file that rotates itself by size and by age.
+
+    Rotation renames path -> path.1 -> ... -> path.<backups> with os.replace,
+    so every step is atomic and nothing is truncated in place the way an
+    external copytruncate does. Only one writer may own a given path.
+    maxbytes or maxage (seconds) of 0 disables that trigger.
+    """
+
+    def __init__(self, path, maxbytes=DEFAULT_MAXBYTES, backups=DEFAULT_BACKUPS, maxage=0):
+        self.path = path
+        self.maxbytes = maxbytes
+        self.backups = backups
+        self.maxage = maxage
+        self.fd = None
+        self.size = 0
+        self.opened_at = 0.0
+
+    def _open(self):
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+        self.size = os.fstat(self.fd).st_size
+        self.opened_at = time.monotonic()
+
+    def _expired(self):
+        return bool(self.size) and bool(self.maxage) and time.monotonic() - self.opened_at >= self.maxage
+
+    def rotate(self):
+        """Move the current file out of the way and start a new one."""
+        self.close()
+        try:
+            if self.backups > 0:
+                for index in range(self.backups - 1, 0, -1):
+                    source = f"{self.path}.{index}"
+                    if os.path.exists(source):
+                        os.replace(source, f"{self.path}.{index + 1}")
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._open()
+
+    def write(self, data):
+        """Append data, rotating whenever it would push the file over a limit.
+
+        A batch larger than the room left is split at the last line boundary
+        that still fits, so the current file is filled up before it rotates
+        and no file ends up bigger than maxbytes.
+        """
+        if self.fd is None:
+            self._open()
+        view = memoryview(data)
+        while view:
+            if self._expired():
+                self.rotate()
+            size = len(view)
+            if self.maxbytes and self.size + size > self.maxbytes:
+                room = max(self.maxbytes - self.size, 0)
+                cut = bytes(view[:room]).rfind(b"\n") + 1
+                if not cut and self.size:
+                    # Not even one whole line fits: continue in a fresh file.
+                    self.rotate()
+                    continue
+                size = cut or room
+            self._write(view[:size])
+            view = view[size:]
+
+    def _write(self, view):
+        self.size += len(view)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+
+    def close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+
+class LogPump:
+    """Drain pipes into RotatingFiles from one thread until every pipe is closed.
+
+    The child only ever writes into a pipe; opening, writing and rotating the
+    log files happens here, off the child's critical path.
+    """
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.thread = None
+
+    def add(self, fd, log):
+        """Drain fd into log (a RotatingFile, or None to discard). Call before start()."""
+        self.selector.register(fd, selectors.EVENT_READ, log)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, name="log-pump", daemon=True)
+        self.thread.start()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _loop(self):
+        while self.selector.get_map():
+            for key, _mask in self.selector.select():
+                try:
+                    data = os.read(key.fd, self.READ_SIZE)
+                except OSError:
+                    data = b""
+                log = key.data
+                if not data:
+                    self.selector.unregister(key.fd)
+                    os.close(key.fd)
+                    if log is not None:
+                        log.close()
+                    continue
+                if log is not None:
+                    try:
+                        log.write(data)
+                    except OSError as e:
+                        print(f"Failed to write to log file {log.path}: {e}")
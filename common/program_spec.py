@@ -0,0 +1,86 @@
+from types import MappingProxyType
+
+_UNSET = object()
+
+
+class ProgramSpec:
+    """Immutable, validated configuration of one program.
+
+    ConfigParser builds one per program and every instance shares it. It
+    reads like the dict it replaces: get(key, default) returns the default
+    for options the config file did not set, and program["name"] works.
+    Use replace() to derive a modified copy.
+    """
+
+    FIELDS = (
+        'cmd', 'numprocs', 'autostart', 'autorestart', 'exitcodes',
+        'starttime', 'startretries', 'stopsignal', 'stoptime', 'stdout',
+        'stderr', 'env', 'workingdir', 'umask', 'scrollback_bytes',
+        'stdout_logfile_maxbytes', 'stdout_logfile_backups', 'stdout_logfile_maxage',
+        'stderr_logfile_maxbytes', 'stderr_logfile_backups', 'stderr_logfile_maxage',
+        'backoff_base', 'backoff_multiplier', 'backoff_max', 'backoff_reset'
+    )
+    __slots__ = ('name',) + FIELDS
+
+    def __init__(self, name, **fields):
+        unknown = set(fields) - set(self.FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown program field(s): {', '.join(sorted(unknown))}")
+        object.__setattr__(self, 'name', name)
+        for field in self.FIELDS:
+            value = fields.get(field, _UNSET)
+            if isinstance(value, list):
+                value = tuple(value)
+            elif isinstance(value, dict):
+                value = MappingProxyType(dict(value))
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ProgramSpec is immutable, use replace()")
+
+    def __delattr__(self, key):
+        raise AttributeError("ProgramSpec is immutable, use replace()")
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        value = getattr(self, key)
+        return default if value is _UNSET else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _UNSET) is not _UNSET
+
+    def keys(self):
+        return [key for key in self.__slots__ if key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        return {key: dict(value) if isinstance(value, MappingProxyType) else value
+                for key, value in self.items()}
+
+    def replace(self, **changes):
+        """Return a copy with some fields changed."""
+        fields = self.to_dict()
+        name = changes.pop('name', fields.pop('name'))
+        fields.update(changes)
+        return ProgramSpec(name, **fields)
+
+    def __eq__(self, other):
+        if not isinstance(other, ProgramSpec):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash((self.name, self.cmd))
+
+    def __repr__(self):
+        fields = ", ".join(f"{key}={value!r}" for key, value in self.items() if key != 'name')
+        return f"ProgramSpec({self.name!r}, {fields})"
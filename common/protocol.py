@@ -0,0 +1,86 @@
+import struct
+from collections import namedtuple
+
+# Every message between taskmasterctl and taskmasterd is one frame:
+#
+#   +----------------+----------------+-----------+---------+-----------+
+#   | length (u32)   | request id u32 | chan u16  | type u8 | payload   |
+#   +----------------+----------------+-----------+---------+-----------+
+#
+# `length` counts the payload only. Channel 0 carries commands and their
+# replies, matched by request id so several requests can be in flight on one
+# connection. Other channels are opened by `attach` and carry terminal traffic.
+
+HEADER = struct.Struct("!IIHB")
+MAX_PAYLOAD = 16 * 1024 * 1024
+REPLY_CHUNK = 64 * 1024
+
+CONTROL_CHANNEL = 0
+
+REQUEST = 1   # client -> daemon, payload is a utf-8 command line
+REPLY = 2     # daemon -> client, one chunk of the reply to a request
+END = 3       # daemon -> client, the reply to a request is complete
+DATA = 4      # both ways, traffic on an attach channel
+CLOSE = 5     # both ways, the attach channel is closed
+
+Frame = namedtuple("Frame", ["type", "request_id", "channel", "payload"])
+
+
+class ProtocolError(Exception):
+    """Raised when the peer sends something that is not a valid frame"""
+    pass
+
+
+def encode_header(frame_type, request_id, channel, length):
+    """Serialize only the header, for callers that send the payload buffer separately."""
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"payload of {length} bytes exceeds {MAX_PAYLOAD}")
+    return HEADER.pack(length, request_id, channel, frame_type)
+
+
+def encode_frame(frame_type, request_id=0, channel=CONTROL_CHANNEL, payload=b""):
+    """Serialize one frame."""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return encode_header(frame_type, request_id, channel, len(payload)) + payload
+
+
+def encode_reply(request_id, text):
+    """Serialize a complete reply as REPLY chunks followed by END."""
+    data = text.encode('utf-8') if isinstance(text, str) else text
+    chunks = [
+        encode_frame(REPLY, request_id, CONTROL_CHANNEL, data[i:i + REPLY_CHUNK])
+        for i in range(0, len(data), REPLY_CHUNK)
+    ]
+    chunks.append(encode_frame(END, request_id))
+    return b"".join(chunks)
+
+
+class FrameDecoder:
+    """Incrementally split a byte stream into frames."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes and return every frame that is now complete."""
+        self.buffer += data
+        frames = []
+        offset = 0
+        view = memoryview(self.buffer)
+        try:
+            while len(self.buffer) - offset >= HEADER.size:
+                length, request_id, channel, frame_type = HEADER.unpack_from(view, offset)
+                if length > MAX_PAYLOAD:
+                    raise ProtocolError(f"frame of {length} bytes exceeds {MAX_PAYLOAD}")
+                end = offset + HEADER.size + length
+                if end > len(self.buffer):
+                    break
+                payload = bytes(view[offset + HEADER.size:end])
+                frames.append(Frame(frame_type, request_id, channel, payload))
+                offset = end
+        finally:
+            view.release()
+        if offset:
+            del self.buffer[:offset]
+        return frames
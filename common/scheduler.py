@@ -0,0 +1,65 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Timer:
+    """Handle of a scheduled call; cancel() prevents it from running."""
+
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """One thread running delayed calls in deadline order.
+
+    Replaces a sleeping thread per pending retry or timeout: call_later()
+    only pushes onto a heap, and the single scheduler thread waits for the
+    earliest deadline. Callbacks run on that thread, so they must be quick
+    and must not block.
+    """
+
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self.condition = threading.Condition()
+        self.heap = []
+        self.sequence = itertools.count()
+        self.thread = None
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(time.monotonic() + max(0.0, delay), callback, args)
+        with self.condition:
+            heapq.heappush(self.heap, (timer.when, next(self.sequence), timer))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return timer
+
+    def call_soon(self, callback, *args):
+        return self.call_later(0, callback, *args)
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                while True:
+                    while self.heap and self.heap[0][2].cancelled:
+                        heapq.heappop(self.heap)
+                    if self.heap and self.heap[0][0] <= time.monotonic():
+                        timer = heapq.heappop(self.heap)[2]
+                        break
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self.condition.wait(timeout)
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"Warning: scheduled call {getattr(timer.callback, '__name__', timer.callback)} failed: {e}")